@@ -0,0 +1,306 @@
+"""Benchmarks for the Twitter conversion and the Hacker News crawler.
+
+Run `python benchmarks/bench.py run` to measure the current tree and compare it
+against `benchmarks/baseline.json`. Pass `--save` to replace the baseline.
+"""
+
+import asyncio
+import gzip
+import json
+import math
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import typing as t
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import arguebuf
+import httpx
+import rich_click as click
+import typed_settings as ts
+from rich import print
+from rich.table import Table
+
+from xarguebuf import common, mock, reader, synthetic
+from xarguebuf.hn import api as hn_api
+from xarguebuf.hn import watch as hn_watch
+from xarguebuf.twitter import client as twitter_client
+from xarguebuf.twitter import convert, count, download
+
+BASELINE = Path(__file__).parent / "baseline.json"
+
+Result = dict[str, float]
+
+# Polls with simulated activity after the initial crawl of `hn watch`
+WATCH_POLLS = 5
+
+
+def measure(
+    func: t.Callable[[], t.Any],
+    repeat: int,
+    setup: t.Optional[t.Callable[[], t.Any]] = None,
+) -> Result:
+    timings: list[float] = []
+
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    return {"min": min(timings), "median": statistics.median(timings)}
+
+
+def bench_twitter(
+    folder: Path, corpus: synthetic.CorpusConfig, repeat: int
+) -> dict[str, Result]:
+    results: dict[str, Result] = {}
+    input_file = folder / "conversations.jsonl"
+    synthetic.write_twitter_corpus(input_file, corpus)
+    config = convert.Config()
+
+    def parse():
+        return convert.parse_response(reader.iter_lines(input_file))
+
+    results["parse_response"] = measure(parse, repeat)
+
+    compressed_file = folder / "conversations.jsonl.gz"
+
+    with input_file.open("rb") as src, gzip.open(compressed_file, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+
+    results["parse_response_gzip"] = measure(
+        lambda: convert.parse_response(reader.iter_lines(compressed_file)), repeat
+    )
+    conversation_ids, tweets, users = parse()
+
+    results["parse_referenced_tweets"] = measure(
+        lambda: convert.parse_referenced_tweets(tweets), repeat
+    )
+    referenced_tweets = convert.parse_referenced_tweets(tweets)
+    participants = convert.parse_participants(users)
+    mc_tweets = [tweets[id] for id in conversation_ids if id in tweets]
+    graphs: list[arguebuf.Graph] = []
+
+    def build():
+        graphs.clear()
+
+        for mc_tweet in mc_tweets:
+            g = arguebuf.Graph()
+            mc_text = convert.process_tweet(mc_tweet["text"], config.tweet.raw_text)
+            mc = convert.build_atom(mc_tweet, mc_text, participants, config.tweet)
+            g.add_node(mc)
+            g.major_claim = mc
+            convert.build_subtree(1, g, mc, referenced_tweets, participants, config)
+            graphs.append(g)
+
+    results["build_subtree"] = measure(build, repeat)
+
+    # Pruning modifies the graphs, so they have to be rebuilt before every run
+    graph_config = common.GraphConfig(min_depth=2, max_depth=4)
+    results["prune_graph"] = measure(
+        lambda: [common.prune_graph(g, graph_config) for g in graphs], repeat, build
+    )
+
+    output_folder = folder / "graphs"
+    results["serialize"] = measure(
+        lambda: [
+            common.serialize(g, output_folder, config.graph, g.major_claim.id)
+            for g in graphs
+            if g.major_claim is not None
+        ],
+        repeat,
+    )
+
+    return results
+
+
+def bench_download(
+    folder: Path, corpus: synthetic.CorpusConfig, repeat: int, latency: float
+) -> dict[str, Result]:
+    responses = list(synthetic.twitter_corpus(corpus))
+    api = mock.Twitter(responses, requests=sys.maxsize)
+    conversation_ids = list(api.conversations.keys())
+    output_file = folder / "downloaded.jsonl"
+
+    with mock.serve(api, latency) as url:
+
+        async def run():
+            async with twitter_client.Client(None, f"{url}/2/") as client:
+                await download.download_conversations(
+                    client,
+                    conversation_ids,
+                    output_file,
+                    concurrency=8,
+                    search_limiter=twitter_client.RateLimiter(sys.maxsize),
+                )
+
+        async def run_count():
+            async with twitter_client.Client(None, f"{url}/2/") as client:
+                await count.count_windows(
+                    client,
+                    "query",
+                    count.split_windows(
+                        datetime(2020, 2, 3, tzinfo=timezone.utc),
+                        datetime(2020, 11, 2, tzinfo=timezone.utc),
+                        timedelta(days=30),
+                    ),
+                    "day",
+                    twitter_client.RateLimiter(sys.maxsize),
+                    count.Cache(None, timedelta(days=30)),
+                )
+
+        return {
+            "twitter_download": measure(
+                lambda: asyncio.run(run()),
+                repeat,
+                lambda: output_file.unlink(missing_ok=True),
+            ),
+            "twitter_count": measure(lambda: asyncio.run(run_count()), repeat),
+        }
+
+
+def bench_hn(
+    folder: Path, corpus_config: synthetic.CorpusConfig, repeat: int, latency: float
+) -> dict[str, Result]:
+    corpus = synthetic.hn_corpus(corpus_config)
+    firebase = mock.Firebase(corpus)
+    generator = synthetic.HnGenerator(corpus_config, corpus)
+
+    def reset():
+        # `churn` grows the corpus, so every run of `watch` starts with a new one
+        nonlocal generator
+        fresh_corpus = synthetic.hn_corpus(corpus_config)
+        firebase.reset(fresh_corpus)
+        generator = synthetic.HnGenerator(corpus_config, fresh_corpus)
+
+    with mock.serve(firebase, latency) as url:
+        config = hn_api.Config(endpoint=hn_api.EndpointConfig(base_url=f"{url}/v0/"))
+
+        async def crawl():
+            async for _ in hn_api.iter_graphs(corpus.stories, config):
+                pass
+
+        async def watch():
+            async with httpx.AsyncClient(base_url=config.endpoint.base_url) as client:
+                # The stories of the corpus are old, so they must not expire
+                watcher = hn_watch.Watcher(config, client, None, 100, math.inf)
+
+                # The first poll crawls all listed stories, the others only changes
+                for poll in range(WATCH_POLLS + 1):
+                    if poll > 0:
+                        firebase.churn(generator, stories=1, comments=20)
+
+                    async for _ in watcher.poll():
+                        pass
+
+        return {
+            "hn_crawl": measure(lambda: asyncio.run(crawl()), repeat),
+            "hn_watch": measure(lambda: asyncio.run(watch()), repeat, reset),
+        }
+
+
+def compare(
+    results: t.Mapping[str, Result],
+    baseline: t.Mapping[str, Result],
+    tolerance: float,
+) -> bool:
+    table = Table("Benchmark", "Median", "Min", "Baseline", "Change")
+    success = True
+
+    for name, result in results.items():
+        reference = baseline.get(name)
+        change = ""
+
+        if reference is not None:
+            ratio = result["median"] / reference["median"] - 1
+            change = f"{ratio:+.1%}"
+
+            if ratio > tolerance:
+                success = False
+                change = f"[red]{change}[/red]"
+
+        table.add_row(
+            name,
+            f"{result['median']:.4f}s",
+            f"{result['min']:.4f}s",
+            f"{reference['median']:.4f}s" if reference else "-",
+            change,
+        )
+
+    print(table)
+
+    return success
+
+
+@click.group()
+def cli():
+    pass
+
+
+@cli.command()
+@click.argument("kind", type=click.Choice(["twitter", "hn"]))
+@click.argument("output_file", type=click.Path(dir_okay=False, path_type=Path))
+@ts.click_options(synthetic.CorpusConfig, "xarguebuf.bench")
+def generate(corpus: synthetic.CorpusConfig, kind: str, output_file: Path):
+    """Generate a synthetic corpus and store it in OUTPUT_FILE"""
+
+    if kind == "twitter":
+        synthetic.write_twitter_corpus(output_file, corpus)
+    else:
+        with output_file.open("w") as fp:
+            json.dump(synthetic.hn_corpus(corpus).to_dict(), fp)
+
+
+@cli.command()
+@click.option("--repeat", default=5, help="Number of runs per benchmark.")
+@click.option(
+    "--latency", default=0.0, help="Simulated latency of the mock server in seconds."
+)
+@click.option(
+    "--tolerance",
+    default=0.2,
+    help="Relative slowdown compared to the baseline that counts as regression.",
+)
+@click.option(
+    "--baseline",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=BASELINE,
+)
+@click.option("--save", is_flag=True, help="Store the results as new baseline.")
+@ts.click_options(synthetic.CorpusConfig, "xarguebuf.bench")
+def run(
+    corpus: synthetic.CorpusConfig,
+    repeat: int,
+    latency: float,
+    tolerance: float,
+    baseline: Path,
+    save: bool,
+):
+    """Run all benchmarks and compare them against the baseline"""
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        folder = Path(tmpdir)
+        results = {
+            **bench_twitter(folder, corpus, repeat),
+            **bench_download(folder, corpus, repeat, latency),
+            **bench_hn(folder, corpus, repeat, latency),
+        }
+
+    reference = json.loads(baseline.read_text()) if baseline.exists() else {}
+    success = compare(results, reference, tolerance)
+
+    if save:
+        baseline.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"Baseline written to '{baseline}'")
+    elif not success:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    cli()
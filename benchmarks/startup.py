@@ -0,0 +1,93 @@
+"""Startup-time budget of the CLI based on `python -X importtime`.
+
+Fails if the imports of a command exceed the budget or if one of the heavy
+dependencies is imported although the command does not need it.
+"""
+
+import re
+import subprocess
+import sys
+import typing as t
+
+import rich_click as click
+from rich import print
+from rich.table import Table
+
+IMPORTTIME_PATTERN = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+HEAVY_MODULES = (
+    "arguebuf",
+    "arg_services",
+    "grpc",
+    "httpx",
+    "pendulum",
+    "pydantic",
+    "twarc",
+)
+
+# Commands that must not load any of the heavy modules
+COMMANDS: t.Sequence[t.Sequence[str]] = (
+    ("--help",),
+    ("hn", "--help"),
+    ("server", "--help"),
+    ("twitter", "--help"),
+    ("twitter", "count", "--help"),
+)
+
+
+def importtime(args: t.Sequence[str]) -> tuple[float, set[str]]:
+    """Return the total import time (in ms) and all modules imported by a command"""
+
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "xarguebuf", *args],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    total = 0
+    modules: set[str] = set()
+
+    for line in proc.stderr.splitlines():
+        if match := IMPORTTIME_PATTERN.match(line):
+            modules.add(match[4])
+
+            # Nested imports are already contained in the cumulative time
+            if len(match[3]) == 1:
+                total += int(match[2])
+
+    return total / 1000, modules
+
+
+@click.command()
+@click.option("--budget", default=300.0, help="Maximum import time per command in ms.")
+@click.option("--runs", default=3, help="Runs per command, the fastest one counts.")
+def main(budget: float, runs: int):
+    table = Table("Command", "Import time", "Heavy modules")
+    success = True
+
+    for args in COMMANDS:
+        measurements = [importtime(args) for _ in range(runs)]
+        duration = min(duration for duration, _ in measurements)
+        heavy = sorted(
+            module
+            for module in measurements[0][1]
+            if module.split(".")[0] in HEAVY_MODULES
+        )
+
+        if duration > budget or heavy:
+            success = False
+
+        table.add_row(
+            " ".join(args),
+            f"[{'red' if duration > budget else 'green'}]{duration:.1f}ms",
+            ", ".join(heavy) or "-",
+        )
+
+    print(table)
+
+    if not success:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
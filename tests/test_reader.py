@@ -0,0 +1,52 @@
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from xarguebuf import reader
+
+LINES = [b'{"id": %d, "text": "%s"}' % (i, b"x" * 100) for i in range(10_000)]
+
+requires_zstd = pytest.mark.skipif(
+    shutil.which("zstd") is None, reason="requires the zstd command line tool"
+)
+
+
+@pytest.fixture
+def zstd_cli(monkeypatch: pytest.MonkeyPatch) -> None:
+    # Importing a module that is mapped to `None` raises an `ImportError`
+    monkeypatch.setitem(sys.modules, "zstandard", None)
+
+
+@pytest.fixture
+def archive(tmp_path: Path) -> Path:
+    plain = tmp_path / "conversations.jsonl"
+    plain.write_bytes(b"\n".join(LINES) + b"\n")
+    subprocess.run(["zstd", "--quiet", "--rm", str(plain)], check=True)
+
+    return tmp_path / "conversations.jsonl.zst"
+
+
+@requires_zstd
+def test_zstd_cli(zstd_cli: None, archive: Path) -> None:
+    assert [line.rstrip(b"\n") for line in reader.iter_lines(archive)] == LINES
+
+
+@requires_zstd
+def test_zstd_cli_truncated(zstd_cli: None, archive: Path) -> None:
+    data = archive.read_bytes()
+    archive.write_bytes(data[: len(data) // 2])
+
+    with pytest.raises(OSError, match="exit code"):
+        list(reader.iter_lines(archive))
+
+
+@requires_zstd
+def test_zstd_cli_stop_early(zstd_cli: None, archive: Path) -> None:
+    lines = reader.iter_lines(archive)
+
+    assert next(lines).rstrip(b"\n") == LINES[0]
+
+    lines.close()
@@ -1,8 +1,67 @@
+import typing as t
+from pathlib import Path
+
 import rich_click as click
 
-from . import hn, twitter
+from . import hn, profiling, twitter
+from .lazy import LazyGroup
+
+server = LazyGroup(
+    name="server",
+    lazy_subcommands={
+        "start": (
+            "xarguebuf.server:serve",
+            "Serve the conversion of Twitter payloads and HN stories over HTTP.",
+        )
+    },
+)
+
+
+@click.group(name="xarguebuf", commands=[hn.cli, server, twitter.cli])
+@click.option(
+    "--profile",
+    type=click.Choice(["cprofile", "sampling"]),
+    default=None,
+    help=(
+        "Profile the invoked command. `cprofile` traces every function call (including"
+        " those of the pipeline threads), `sampling` periodically captures the stacks"
+        " of all threads."
+    ),
+)
+@click.option(
+    "--profile-output",
+    type=click.Path(dir_okay=False, writable=True, path_type=Path),
+    default=None,
+    help=(
+        "File the profile is written to. Defaults to `xarguebuf.prof` (pstats) for"
+        " `cprofile` and `xarguebuf.collapsed` (collapsed stacks) for `sampling`."
+    ),
+)
+@click.option(
+    "--profile-top",
+    type=int,
+    default=0,
+    help="Print a summary of the N most expensive functions after the run.",
+)
+@click.option(
+    "--profile-interval",
+    type=float,
+    default=0.005,
+    help="Seconds between two samples in `sampling` mode.",
+)
+@click.pass_context
+def cli(
+    ctx: click.Context,
+    profile: t.Optional[profiling.Mode],
+    profile_output: t.Optional[Path],
+    profile_top: int,
+    profile_interval: float,
+):
+    if profile is not None:
+        ctx.call_on_close(
+            profiling.start(profile, profile_output, profile_top, profile_interval)
+        )
 
-cli = click.Group(name="xarguebuf", commands=[hn.cli, twitter.cli])
 
 if __name__ == "__main__":
     cli()
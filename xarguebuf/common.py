@@ -7,20 +7,16 @@ from shutil import rmtree
 import arguebuf
 import attrs
 import typed_settings as ts
-from arg_services.mining.v1beta import adu_pb2, entailment_pb2, entailment_pb2_grpc
+
+from xarguebuf import metrics
+
+# grpc and the protobuf modules are only needed if an entailment service is used
+if t.TYPE_CHECKING:
+    from arg_services.mining.v1beta import entailment_pb2_grpc
 
 
 @ts.settings(frozen=True)
-class GraphConfig:
-    render: bool = ts.option(
-        default=False,
-        click={"param_decls": "--graph-render", "is_flag": True},
-        help=(
-            "If set, the graphs will be rendered and stored as PDF files besides the"
-            " source. Note: Only works in Docker or if graphviz is installed on your"
-            " system."
-        ),
-    )
+class GraphFilterConfig:
     min_depth: int = ts.option(
         default=0,
         help=(
@@ -55,8 +51,34 @@ class GraphConfig:
     )
 
 
+@ts.settings(frozen=True, slots=False)
+class RenderConfig:
+    render: bool = ts.option(
+        default=False,
+        click={"param_decls": "--graph-render", "is_flag": True},
+        help=(
+            "If set, the graphs will be rendered and stored as PDF files besides the"
+            " source. Note: Only works in Docker or if graphviz is installed on your"
+            " system."
+        ),
+    )
+
+
+# Attributes of the bases are collected in reverse order of the MRO, so `render`
+# stays the first option (in the CLI and `config.json`). `RenderConfig` has no
+# slots since two slotted bases cannot be combined.
+@ts.settings(frozen=True)
+class GraphConfig(GraphFilterConfig, RenderConfig):
+    pass
+
+
 # Remove nodes that do not match the depth criterions
-def prune_graph(g: arguebuf.Graph, config: GraphConfig) -> arguebuf.Graph:
+def prune_graph(g: arguebuf.Graph, config: GraphFilterConfig) -> arguebuf.Graph:
+    with metrics.registry.stage("prune"):
+        return _prune_graph(g, config)
+
+
+def _prune_graph(g: arguebuf.Graph, config: GraphFilterConfig) -> arguebuf.Graph:
     mc = g.major_claim
     assert mc is not None
 
@@ -75,6 +97,13 @@ def prune_graph(g: arguebuf.Graph, config: GraphConfig) -> arguebuf.Graph:
             is not None
         )
 
+        if not min_depth_valid:
+            metrics.registry.filtered("leaf", "min_depth")
+        elif not max_depth_valid:
+            metrics.registry.filtered("leaf", "max_depth")
+        else:
+            metrics.registry.filtered("leaf", None)
+
         if not (min_depth_valid and max_depth_valid):
             nodes_to_remove: set[arguebuf.AbstractNode] = {leaf}
 
@@ -94,8 +123,18 @@ def prepare_output(
     folder: Path,
     config: attrs.AttrsInstance,
     ignored_attrs: t.Optional[t.Iterable[str]] = None,
-) -> None:
-    if folder.is_dir():
+    keep_existing: bool = False,
+) -> bool:
+    """Create an empty output folder and store the config in it.
+
+    With `keep_existing`, the graphs and the config of a previous run are kept and
+    the config is only written to a new folder. Returns whether it was written.
+    """
+
+    if keep_existing and (folder / "config.json").exists():
+        return False
+
+    if folder.is_dir() and not keep_existing:
         rmtree(folder)
 
     folder.mkdir(parents=True, exist_ok=True)
@@ -107,6 +146,21 @@ def prepare_output(
     with (folder / "config.json").open("w") as fp:
         json.dump(config_dict, fp)
 
+    return True
+
+
+def accept_graph(g: arguebuf.Graph, config: GraphFilterConfig) -> bool:
+    if len(g.atom_nodes) < config.min_nodes:
+        metrics.registry.filtered("graph", "min_nodes")
+        return False
+    elif len(g.atom_nodes) > config.max_nodes:
+        metrics.registry.filtered("graph", "max_nodes")
+        return False
+
+    metrics.registry.filtered("graph", None)
+
+    return True
+
 
 def serialize(
     g: arguebuf.Graph,
@@ -114,45 +168,101 @@ def serialize(
     config: GraphConfig,
     graph_id: str,
 ) -> None:
-    if not (
-        len(g.atom_nodes) >= config.min_nodes and len(g.atom_nodes) <= config.max_nodes
-    ):
-        return
-
     p = output_folder / graph_id
     p.parent.mkdir(parents=True, exist_ok=True)
+    _dump(g, p, config)
+
+
+class GraphWriter:
+    """Serializes batches of graphs, e.g., as batched stage of a pipeline.
+
+    Folders are created once and remembered, so later graphs do not touch them
+    again. Errors are counted per graph (`write` in the metrics) and only the
+    graphs that have been written are returned.
+    """
+
+    def __init__(self, output_folder: Path, config: GraphConfig) -> None:
+        self.output_folder = output_folder
+        self.config = config
+        self._folders: set[Path] = set()
 
-    arguebuf.dump.file(g, p.with_suffix(".json"))
+    def __call__(self, graphs: t.Sequence[arguebuf.Graph]) -> list[arguebuf.Graph]:
+        written: list[arguebuf.Graph] = []
+
+        for g in graphs:
+            try:
+                self.write(g)
+            except Exception as e:
+                metrics.registry.filtered("write", "error")
+                print(f"Error when writing graph {g.major_claim}: {e!r}")
+            else:
+                metrics.registry.filtered("write", None)
+                written.append(g)
+
+        return written
+
+    def write(self, g: arguebuf.Graph) -> None:
+        assert g.major_claim is not None
+        path = self.output_folder / g.major_claim.id
+
+        if path.parent not in self._folders:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._folders.add(path.parent)
+
+        _dump(g, path, self.config)
+
+
+def _dump(g: arguebuf.Graph, p: Path, config: GraphConfig) -> None:
+    with metrics.registry.stage("serialize"):
+        arguebuf.dump.file(g, p.with_suffix(".json"))
 
     if config.render:
-        try:
-            arguebuf.render.graphviz(arguebuf.dump.graphviz(g), p.with_suffix(".pdf"))
-        except Exception as e:
-            print(f"Error when trying to render {p}:\n{e}")
+        with metrics.registry.stage("render"):
+            try:
+                arguebuf.render.graphviz(
+                    arguebuf.dump.graphviz(g), p.with_suffix(".pdf")
+                )
+            except Exception as e:
+                print(f"Error when trying to render {p}:\n{e}")
+
+
+def entailment_client(
+    address: t.Optional[str],
+) -> t.Optional["entailment_pb2_grpc.EntailmentServiceStub"]:
+    if not address:
+        return None
+
+    import grpc
+    from arg_services.mining.v1beta import entailment_pb2_grpc
+
+    return entailment_pb2_grpc.EntailmentServiceStub(grpc.insecure_channel(address))
 
 
 def predict_schemes(
     g: arguebuf.Graph,
     language: str = "en",
-    client: t.Optional[entailment_pb2_grpc.EntailmentServiceStub] = None,
+    client: t.Optional["entailment_pb2_grpc.EntailmentServiceStub"] = None,
 ) -> arguebuf.Graph:
     if client:
-        res: entailment_pb2.EntailmentsResponse = client.Entailments(
-            entailment_pb2.EntailmentsRequest(
-                language=language,
-                adus={
-                    node.id: adu_pb2.Segment(text=node.plain_text)
-                    for node in g.atom_nodes.values()
-                },
-                query=[
-                    entailment_pb2.EntailmentQuery(
-                        premise_id=next(iter(g.incoming_nodes(scheme))).id,
-                        claim_id=next(iter(g.outgoing_nodes(scheme))).id,
-                    )
-                    for scheme in g.scheme_nodes.values()
-                ],
+        from arg_services.mining.v1beta import adu_pb2, entailment_pb2
+
+        with metrics.registry.stage("entailment"):
+            res: entailment_pb2.EntailmentsResponse = client.Entailments(
+                entailment_pb2.EntailmentsRequest(
+                    language=language,
+                    adus={
+                        node.id: adu_pb2.Segment(text=node.plain_text)
+                        for node in g.atom_nodes.values()
+                    },
+                    query=[
+                        entailment_pb2.EntailmentQuery(
+                            premise_id=next(iter(g.incoming_nodes(scheme))).id,
+                            claim_id=next(iter(g.outgoing_nodes(scheme))).id,
+                        )
+                        for scheme in g.scheme_nodes.values()
+                    ],
+                )
             )
-        )
 
         for scheme_node, entailment in zip(g.scheme_nodes.values(), res.entailments):
             if entailment.type == entailment_pb2.ENTAILMENT_TYPE_ENTAILMENT:
@@ -1,5 +1,29 @@
-import rich_click as click
+import typing as t
 
-from . import api
+from xarguebuf.lazy import LazyGroup
 
-cli = click.CommandCollection(name="hn", sources=[api.cli])
+if t.TYPE_CHECKING:
+    from .api import CommentConfig, Config, StoryConfig, iter_graphs
+
+__all__ = ["CommentConfig", "Config", "StoryConfig", "iter_graphs", "cli"]
+
+cli = LazyGroup(
+    name="hn",
+    lazy_subcommands={
+        "api": ("xarguebuf.hn.api:hn", "Convert the given stories to argument graphs."),
+        "watch": (
+            "xarguebuf.hn.watch:watch",
+            "Continuously convert new and updated stories.",
+        ),
+    },
+)
+
+
+def __getattr__(name: str) -> t.Any:
+    # The library API is imported on first access to keep the CLI startup fast
+    if name in ("CommentConfig", "Config", "StoryConfig", "iter_graphs"):
+        from . import api
+
+        return getattr(api, name)
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,6 +1,8 @@
 import asyncio
+import functools
 import itertools
 import sys
+import time
 import typing as t
 from collections import defaultdict
 from functools import wraps
@@ -10,17 +12,21 @@ from pathlib import Path
 from typing import Literal, Optional
 
 import arguebuf
-import grpc
 import httpx
 import pendulum
 import rich
 import rich_click as click
 import typed_settings as ts
-from arg_services.mining.v1beta import entailment_pb2_grpc
 from pendulum.datetime import DateTime
 from pydantic import BaseModel
 
-from xarguebuf import common
+from xarguebuf import common, metrics, pipeline
+
+if t.TYPE_CHECKING:
+    from arg_services.mining.v1beta import entailment_pb2_grpc
+
+# Maximum number of graphs the writer stage serializes at once
+WRITE_BATCH_SIZE = 16
 
 
 class Story(BaseModel):
@@ -45,6 +51,10 @@ class Comment(BaseModel):
 
 
 Item = Story | Comment
+# The story, its comments grouped by their parent and all participants
+Discussion = t.Tuple[
+    Story, t.Mapping[str, t.Collection[Comment]], t.Mapping[str, arguebuf.Participant]
+]
 
 
 class User(BaseModel):
@@ -83,6 +93,14 @@ class RawItem(BaseModel):
         return None
 
 
+class ItemNotFound(LookupError):
+    """The API returned no item for the id (e.g., because it does not exist)"""
+
+    def __init__(self, id: int) -> None:
+        super().__init__(f"Item {id} not found.")
+        self.id = id
+
+
 # https://stackoverflow.com/a/925630
 class MLStripper(HTMLParser):
     def __init__(self):
@@ -161,16 +179,26 @@ class EndpointConfig:
     max_stories: int = ts.option(
         default=sys.maxsize,
     )
+    base_url: str = ts.option(
+        default="https://hacker-news.firebaseio.com/v0/",
+        help="Base url of the Hacker News API (e.g., to use a local mirror).",
+    )
 
 
 @ts.settings(frozen=True)
 class Config:
-    output_folder: Path
     graph: common.GraphConfig = common.GraphConfig()
     comment: CommentConfig = CommentConfig()
     story: StoryConfig = StoryConfig()
     endpoint: EndpointConfig = EndpointConfig()
     entailment_address: t.Optional[str] = ts.option(default=None)
+    concurrency: int = ts.option(
+        default=4,
+        help=(
+            "Number of stories that are crawled concurrently (and of threads querying"
+            " the entailment service)."
+        ),
+    )
 
 
 def coro(f):
@@ -181,93 +209,230 @@ def coro(f):
     return wrapper
 
 
-@click.group()
-def cli():
-    pass
-
-
-@cli.command("api")
+@click.command("api")
 @click.argument("ids", type=int, nargs=-1)
+@click.option(
+    "--output-folder",
+    type=click.Path(writable=True, file_okay=False, path_type=Path),
+    required=True,
+    help="Path to a folder where the processed graphs should be stored.",
+)
+@click.option(
+    "--metrics-prometheus",
+    type=click.Path(dir_okay=False, writable=True, path_type=Path),
+    default=None,
+    help=(
+        "Additionally write the run metrics to this file in the Prometheus text"
+        " format (e.g., for the textfile collector of the node exporter)."
+    ),
+)
 @ts.click_options(Config, "xarguebuf.hn")
 @coro
-async def hn(config: Config, ids: tuple[int, ...]):
-    all_ids = list(ids)
-    common.prepare_output(config.output_folder, config, ["output_folder"])
+async def hn(
+    config: Config,
+    ids: tuple[int, ...],
+    output_folder: Path,
+    metrics_prometheus: t.Optional[Path],
+):
+    common.prepare_output(output_folder, config)
+    entailment_client = common.entailment_client(config.entailment_address)
+    writer = pipeline.Stage(
+        "serialize",
+        common.GraphWriter(output_folder, config.graph),
+        batch_size=WRITE_BATCH_SIZE,
+    )
+
+    try:
+        async with (
+            httpx.AsyncClient(base_url=config.endpoint.base_url) as client,
+            metrics.event_loop_monitor(),
+        ):
+            await graph_pipeline(config, client, entailment_client).then(
+                writer
+            ).consume(iter_story_ids(ids, config, client))
+    finally:
+        metrics.write(output_folder, metrics_prometheus)
+
 
-    entailment_client = (
-        entailment_pb2_grpc.EntailmentServiceStub(
-            grpc.insecure_channel(config.entailment_address)
+async def iter_story_ids(
+    ids: t.Iterable[int], config: Config, http_client: httpx.AsyncClient
+) -> t.AsyncIterator[int]:
+    for id in ids:
+        yield id
+
+    if config.endpoint.name is not None:
+        res = await fetch_json(http_client, f"{config.endpoint.name}.json")
+        endpoint_ids: list[int] = res[: config.endpoint.max_stories]
+
+        for id in endpoint_ids:
+            yield id
+
+
+def graph_pipeline(
+    config: Config,
+    http_client: httpx.AsyncClient,
+    entailment_client: t.Optional["entailment_pb2_grpc.EntailmentServiceStub"],
+) -> pipeline.Pipeline:
+    """Pipeline that crawls the story ids of its source and yields their graphs.
+
+    `config.concurrency` stories are crawled on the event loop at the same time.
+    Building the graphs and the blocking requests to the entailment service happen
+    in threads, so they do not stall the requests of the other stories.
+    """
+
+    async def crawl(id: int) -> t.Optional[Discussion]:
+        return await fetch_discussion(id, config, http_client)
+
+    stages = [
+        pipeline.Stage("crawl", crawl, mode="async", concurrency=config.concurrency),
+        pipeline.Stage("build", functools.partial(build_graph, config=config)),
+    ]
+
+    if entailment_client is not None:
+        stages.append(
+            pipeline.Stage(
+                "predict",
+                functools.partial(common.predict_schemes, client=entailment_client),
+                concurrency=config.concurrency,
+            )
         )
-        if config.entailment_address
-        else None
-    )
 
-    async with httpx.AsyncClient(
-        base_url="https://hacker-news.firebaseio.com/v0/"
-    ) as http_client:
-        if config.endpoint.name is not None:
-            res = await http_client.get(f"{config.endpoint.name}.json")
-            endpoint_ids: list[int] = res.json()[: config.endpoint.max_stories]
-            all_ids.extend(endpoint_ids)
+    return pipeline.Pipeline(stages)
 
-        for id in all_ids:
-            g = await build_graph(id, config, http_client, entailment_client)
 
-            if g is not None:
-                mc = g.major_claim
+async def iter_graphs(
+    ids: t.Iterable[int],
+    config: Config = Config(),
+    http_client: t.Optional[httpx.AsyncClient] = None,
+    entailment_client: t.Optional["entailment_pb2_grpc.EntailmentServiceStub"] = None,
+) -> t.AsyncIterator[arguebuf.Graph]:
+    """Crawl the given stories (and those of `config.endpoint`) and yield their graphs.
+
+    Up to `config.concurrency` stories are crawled at the same time and their
+    graphs are yielded in the order they are completed. Only graphs matching
+    `config.story` and the node limits of `config.graph` are yielded. If no clients
+    are passed, they are created from `config` and closed afterwards.
+    """
+
+    if http_client is None:
+        async with httpx.AsyncClient(base_url=config.endpoint.base_url) as client:
+            async for g in iter_graphs(ids, config, client, entailment_client):
+                yield g
+
+        return
+
+    if entailment_client is None:
+        entailment_client = common.entailment_client(config.entailment_address)
+
+    async for g in graph_pipeline(config, http_client, entailment_client).stream(
+        iter_story_ids(ids, config, http_client)
+    ):
+        yield g
+
 
-                if mc is not None:
-                    common.serialize(
-                        g,
-                        config.output_folder,
-                        config.graph,
-                        mc.id,
-                    )
+async def fetch_json(http_client: httpx.AsyncClient, url: str) -> t.Any:
+    with metrics.registry.stage("fetch"):
+        response = await http_client.get(url)
 
+    response.raise_for_status()
 
-async def build_graph(
+    return response.json()
+
+
+async def fetch_item(http_client: httpx.AsyncClient, id: int) -> RawItem:
+    # Firebase responds with `null` to ids that do not exist (yet)
+    if (data := await fetch_json(http_client, f"item/{id}.json")) is None:
+        raise ItemNotFound(id)
+
+    return RawItem(**data)
+
+
+async def fetch_discussion(
     id: int,
     config: Config,
     http_client: httpx.AsyncClient,
-    entailment_client: t.Optional[entailment_pb2_grpc.EntailmentServiceStub],
-) -> arguebuf.Graph | None:
+) -> Discussion | None:
     rich.print(f"Processing story {id}...")
     parent: int | None = id
     item: RawItem | None = None
 
     while parent is not None:
-        response = await http_client.get(f"item/{parent}.json")
-        item = RawItem(**response.json())
+        item = await fetch_item(http_client, parent)
         parent = item.parent
 
     if item is None:
         return None
 
     story = item.parse()
+    reason = reject_story(story, config.story)
+    metrics.registry.filtered("story", reason)
 
-    if (
-        not isinstance(story, Story)
-        or story.score < config.story.min_score
-        or story.score > config.story.max_score
-        or story.descendants < config.story.min_descendants
-        or story.descendants > config.story.max_descendants
-    ):
+    if reason is not None or not isinstance(story, Story):
         return None
 
     comments = await fetch_comments(story, config, http_client)
     comments_chain = itertools.chain.from_iterable(comments.values())
     participants = await build_participants([story, *comments_chain], http_client)
 
-    mc = build_atom(story, participants)
-    g = arguebuf.Graph()
-    g.add_node(mc)
-    g.major_claim = mc
+    return story, comments, participants
 
-    g = build_subtree(0, g, mc, comments, participants)
-    g = common.prune_graph(g, config.graph)
-    g = common.predict_schemes(g, client=entailment_client)
 
-    return g
+def build_graph(discussion: Discussion, config: Config) -> t.Optional[arguebuf.Graph]:
+    start = time.perf_counter()
+    g = assemble_graph(*discussion, config)
+    metrics.registry.observe("graph_latency", time.perf_counter() - start)
+
+    if g.major_claim is not None and common.accept_graph(g, config.graph):
+        return g
+
+    return None
+
+
+def assemble_graph(
+    story: Story,
+    comments: t.Mapping[str, t.Collection[Comment]],
+    participants: t.Mapping[str, arguebuf.Participant],
+    config: Config,
+) -> arguebuf.Graph:
+    with metrics.registry.stage("build"):
+        mc = build_atom(story, participants)
+        g = arguebuf.Graph()
+        g.add_node(mc)
+        g.major_claim = mc
+
+        g = build_subtree(0, g, mc, comments, participants)
+
+    return common.prune_graph(g, config.graph)
+
+
+def reject_story(story: Item | None, config: StoryConfig) -> t.Optional[str]:
+    """Return the name of the first filter the story does not pass (if any)"""
+
+    if not isinstance(story, Story):
+        return "type"
+    if story.score < config.min_score:
+        return "min_score"
+    if story.score > config.max_score:
+        return "max_score"
+    if story.descendants < config.min_descendants:
+        return "min_descendants"
+    if story.descendants > config.max_descendants:
+        return "max_descendants"
+
+    return None
+
+
+def reject_comment(comment: Item | None, config: CommentConfig) -> t.Optional[str]:
+    """Return the name of the first filter the comment does not pass (if any)"""
+
+    if not isinstance(comment, Comment):
+        return "type"
+    if len(comment.text) < config.min_chars:
+        return "min_chars"
+    if len(comment.text) > config.max_chars:
+        return "max_chars"
+
+    return None
 
 
 def parse_timestamp(value: int) -> DateTime:
@@ -317,14 +482,18 @@ def build_atom(
 
 
 async def build_participants(
-    items: t.Iterable[Item], http_client: httpx.AsyncClient
+    items: t.Iterable[Item],
+    http_client: httpx.AsyncClient,
+    participants: t.Optional[dict[str, arguebuf.Participant]] = None,
 ) -> dict[str, arguebuf.Participant]:
-    participants: dict[str, arguebuf.Participant] = {}
+    """Fetch the authors of the items that are not yet contained in `participants`"""
+
+    if participants is None:
+        participants = {}
 
     for item in items:
         if item.by not in participants:
-            res = await http_client.get(f"user/{item.by}.json")
-            user = User(**res.json())
+            user = User(**await fetch_json(http_client, f"user/{item.by}.json"))
 
             participants[user.id] = arguebuf.Participant(
                 id=user.id,
@@ -354,15 +523,15 @@ async def fetch_comments(
 
     while len(queue) > 0:
         comment_id = queue.pop()
-        res = await http_client.get(f"item/{comment_id}.json")
-        item = RawItem(**res.json())
-        comment = item.parse()
-
-        if (
-            isinstance(comment, Comment)
-            and len(comment.text) >= config.comment.min_chars
-            and len(comment.text) <= config.comment.max_chars
-        ):
+        try:
+            comment = (await fetch_item(http_client, comment_id)).parse()
+        except ItemNotFound:
+            comment = None
+
+        reason = reject_comment(comment, config.comment)
+        metrics.registry.filtered("comment", reason)
+
+        if reason is None and isinstance(comment, Comment):
             comments[str(comment.parent)].append(comment)
 
             if comment.kids is not None:
@@ -0,0 +1,372 @@
+import asyncio
+import functools
+import itertools
+import time
+import typing as t
+from collections import OrderedDict, defaultdict
+from pathlib import Path
+
+import arguebuf
+import attrs
+import httpx
+import rich_click as click
+import typed_settings as ts
+from rich import print
+
+from xarguebuf import common, metrics, pipeline
+
+from . import api
+
+if t.TYPE_CHECKING:
+    from arg_services.mining.v1beta import entailment_pb2_grpc
+
+
+@attrs.define
+class ActiveStory:
+    story: api.Story
+    comments: dict[int, api.Comment] = attrs.field(factory=dict)
+    participants: dict[str, arguebuf.Participant] = attrs.field(factory=dict)
+    # Comments that did not pass the filters, so they are not fetched again
+    rejected: set[int] = attrs.field(factory=set)
+
+
+class Watcher:
+    """Keeps the items of the latest stories and re-crawls them when they change.
+
+    The stories are stored in a table of at most `max_stories` entries ordered by
+    their last change, so inactive stories are evicted first. Stories older than
+    `max_age` seconds are removed as well.
+    """
+
+    def __init__(
+        self,
+        config: api.Config,
+        http_client: httpx.AsyncClient,
+        entailment_client: t.Optional["entailment_pb2_grpc.EntailmentServiceStub"],
+        max_stories: int,
+        max_age: float,
+    ) -> None:
+        self.config = config
+        self.http_client = http_client
+        self.entailment_client = entailment_client
+        self.max_stories = max_stories
+        self.max_age = max_age
+        self.stories: OrderedDict[int, ActiveStory] = OrderedDict()
+        # Maps the ids of all tracked (and rejected) items to the id of their story
+        self.owners: dict[int, int] = {}
+        # Listed stories that have been crawled successfully, used to detect new ones
+        self.listed: set[int] = set()
+        self.poll_started = 0.0
+
+    async def poll(
+        self, sink: t.Optional[pipeline.Stage] = None
+    ) -> t.AsyncIterator[arguebuf.Graph]:
+        """Crawl new and changed stories and yield their updated graphs.
+
+        If given, the graphs are passed to `sink` first, which has to return them
+        (e.g., a batched `common.GraphWriter`).
+        """
+
+        self.poll_started = time.perf_counter()
+        endpoint = self.config.endpoint.name or "newstories"
+
+        try:
+            listed, updates = await asyncio.gather(
+                api.fetch_json(self.http_client, f"{endpoint}.json"),
+                api.fetch_json(self.http_client, "updates.json"),
+            )
+        except (httpx.HTTPError, ValueError) as e:
+            # The changes are reported again by the next poll
+            metrics.registry.filtered("poll", "error")
+            print(f"Error when polling the changes, skipping this poll: {e!r}")
+            return
+
+        metrics.registry.filtered("poll", None)
+        listed = listed[: self.config.endpoint.max_stories]
+        changes: defaultdict[int, set[int]] = defaultdict(set)
+
+        # The list is ordered from new to old, so the newest stories are kept
+        for id in listed[: self.max_stories]:
+            if id not in self.listed and id not in self.stories:
+                changes[id].add(id)
+
+        for id in updates.get("items", []):
+            if (story_id := self.owners.get(id)) is not None:
+                changes[story_id].add(id)
+
+        # Stories that are no longer listed are new if they appear again, the others
+        # are added by `refresh` once they have been crawled
+        self.listed.intersection_update(listed)
+
+        stages = [
+            pipeline.Stage(
+                "refresh", self.refresh, "async", concurrency=self.config.concurrency
+            ),
+            pipeline.Stage("build", self.build_graph),
+        ]
+
+        if self.entailment_client is not None:
+            stages.append(
+                pipeline.Stage(
+                    "predict",
+                    functools.partial(
+                        common.predict_schemes, client=self.entailment_client
+                    ),
+                    concurrency=self.config.concurrency,
+                )
+            )
+
+        if sink is not None:
+            stages.append(sink)
+
+        async for g in pipeline.Pipeline(stages).stream(changes.items()):
+            metrics.registry.observe(
+                "watch_latency", time.perf_counter() - self.poll_started
+            )
+            yield g
+
+        self.evict()
+
+    async def refresh(
+        self, change: tuple[int, t.Collection[int]]
+    ) -> t.Optional[ActiveStory]:
+        """Fetch the changed items of a story, return it if it has been modified"""
+
+        story_id, item_ids = change
+        state = self.stories.get(story_id)
+        new_kids: list[int] = []
+
+        if state is None:
+            story = await self.fetch_item(story_id)
+
+            if not isinstance(story, api.Story):
+                metrics.registry.filtered("active_story", "type")
+                self.listed.add(story_id)
+                return None
+
+            # The story is only tracked once it has been crawled completely, so that
+            # the next poll retries it after errors
+            state = ActiveStory(story)
+            new_kids.extend(story.kids or [])
+        else:
+            modified = False
+
+            for id in item_ids:
+                old_item = state.story if id == story_id else state.comments.get(id)
+                item = await self.fetch_item(id)
+
+                if item == old_item:
+                    continue
+
+                if isinstance(item, api.Story):
+                    state.story = item
+                elif (
+                    isinstance(item, api.Comment)
+                    and api.reject_comment(item, self.config.comment) is None
+                ):
+                    state.comments[id] = item
+                    state.rejected.discard(id)
+                elif id in state.rejected:
+                    continue
+                else:
+                    # Deleted, dead or no longer matching the filters
+                    self.remove_comment(state, id)
+                    state.rejected.add(id)
+                    modified = True
+                    continue
+
+                modified = True
+                new_kids.extend(
+                    kid
+                    for kid in item.kids or []
+                    if kid not in state.comments and kid not in state.rejected
+                )
+
+            if not modified:
+                return None
+
+        await self.crawl(state, new_kids)
+        await api.build_participants(
+            [state.story, *state.comments.values()],
+            self.http_client,
+            state.participants,
+        )
+
+        if story_id in self.stories:
+            self.stories.move_to_end(story_id)
+        else:
+            self.stories[story_id] = state
+
+        # Rejected comments are tracked as well, they may pass the filters after an
+        # update
+        self.owners.update(
+            dict.fromkeys([story_id, *state.comments, *state.rejected], story_id)
+        )
+        self.listed.add(story_id)
+
+        return state
+
+    async def fetch_item(self, id: int) -> t.Optional[api.Item]:
+        try:
+            return (await api.fetch_item(self.http_client, id)).parse()
+        except api.ItemNotFound:
+            return None
+
+    async def crawl(self, state: ActiveStory, ids: t.Iterable[int]) -> None:
+        """Fetch the subtrees below the given comments level by level"""
+
+        level = list(ids)
+
+        while level:
+            items = await asyncio.gather(*(self.fetch_item(id) for id in level))
+            ids, level = level, []
+
+            for id, comment in zip(ids, items):
+                reason = api.reject_comment(comment, self.config.comment)
+                metrics.registry.filtered("comment", reason)
+
+                if reason is None and isinstance(comment, api.Comment):
+                    state.comments[id] = comment
+                    level.extend(comment.kids or [])
+                else:
+                    state.rejected.add(id)
+
+    def remove_comment(self, state: ActiveStory, id: int) -> None:
+        remaining = [id]
+
+        while remaining:
+            comment = state.comments.pop(remaining.pop(), None)
+
+            if comment is not None:
+                self.owners.pop(comment.id, None)
+                remaining.extend(comment.kids or [])
+
+    def build_graph(self, state: ActiveStory) -> t.Optional[arguebuf.Graph]:
+        reason = api.reject_story(state.story, self.config.story)
+        metrics.registry.filtered("story", reason)
+
+        if reason is not None:
+            return None
+
+        comments: defaultdict[str, list[api.Comment]] = defaultdict(list)
+
+        for comment in state.comments.values():
+            comments[str(comment.parent)].append(comment)
+
+        g = api.assemble_graph(state.story, comments, state.participants, self.config)
+
+        if g.major_claim is not None and common.accept_graph(g, self.config.graph):
+            return g
+
+        return None
+
+    def evict(self) -> None:
+        min_time = time.time() - self.max_age
+
+        for story_id, state in list(self.stories.items()):
+            if state.story.time < min_time:
+                self.remove_story(story_id, "expired")
+
+        while len(self.stories) > self.max_stories:
+            self.remove_story(next(iter(self.stories)), "evicted")
+
+    def remove_story(self, story_id: int, reason: str) -> None:
+        state = self.stories.pop(story_id)
+        self.owners.pop(story_id, None)
+
+        for id in [*state.comments, *state.rejected]:
+            self.owners.pop(id, None)
+
+        metrics.registry.filtered("active_story", reason)
+
+
+@click.command("watch")
+@click.option(
+    "--output-folder",
+    type=click.Path(writable=True, file_okay=False, path_type=Path),
+    required=True,
+    help="Path to a folder where the processed graphs should be stored.",
+)
+@click.option(
+    "--interval", default=30.0, help="Seconds between the start of two polls."
+)
+@click.option(
+    "--max-active",
+    default=1000,
+    help="Number of stories that are tracked at most (inactive ones are evicted).",
+)
+@click.option(
+    "--max-age",
+    default=48 * 60 * 60.0,
+    help="Seconds after which a story is no longer tracked.",
+)
+@click.option(
+    "--polls",
+    default=0,
+    help="Stop after this number of polls (0 runs until interrupted).",
+)
+@click.option(
+    "--metrics-prometheus",
+    type=click.Path(dir_okay=False, writable=True, path_type=Path),
+    default=None,
+    help=(
+        "Additionally write the run metrics to this file in the Prometheus text"
+        " format (e.g., for the textfile collector of the node exporter)."
+    ),
+)
+@ts.click_options(api.Config, "xarguebuf.hn")
+@api.coro
+async def watch(
+    config: api.Config,
+    output_folder: Path,
+    interval: float,
+    max_active: int,
+    max_age: float,
+    polls: int,
+    metrics_prometheus: t.Optional[Path],
+):
+    """Continuously convert new and updated stories (default: `newstories`)
+
+    Every poll fetches the story list and the `updates` endpoint, re-crawls only
+    the changed parts of the tracked stories and overwrites their graphs once they
+    match the filters. The time from the start of a poll until a graph has been
+    written is reported as `watch_latency` in the metrics.
+    """
+
+    common.prepare_output(output_folder, config)
+    entailment_client = common.entailment_client(config.entailment_address)
+
+    writer = pipeline.Stage(
+        "serialize",
+        common.GraphWriter(output_folder, config.graph),
+        batch_size=api.WRITE_BATCH_SIZE,
+    )
+
+    async with (
+        httpx.AsyncClient(base_url=config.endpoint.base_url) as client,
+        metrics.event_loop_monitor(),
+    ):
+        watcher = Watcher(config, client, entailment_client, max_active, max_age)
+
+        for poll in itertools.count(1):
+            updated = 0
+
+            async for g in watcher.poll(writer):
+                updated += 1
+                latency = time.perf_counter() - watcher.poll_started
+                print(
+                    f"Story {g.major_claim.id if g.major_claim else '?'} updated"
+                    f" ({len(g.atom_nodes)} nodes, {latency:.2f}s after the poll)"
+                )
+
+            elapsed = time.perf_counter() - watcher.poll_started
+            print(
+                f"Poll {poll}: {updated} graphs written, {len(watcher.stories)} active"
+                f" stories ({elapsed:.2f}s)"
+            )
+            metrics.write(output_folder, metrics_prometheus)
+
+            if polls and poll >= polls:
+                break
+
+            await asyncio.sleep(max(interval - elapsed, 0))
@@ -0,0 +1,71 @@
+"""Request handler shared by the HTTP service and the mocks of the upstream APIs."""
+
+import json
+import time
+import typing as t
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlsplit
+
+# Status code, payload (JSON or plain text) and additional headers
+Response = t.Tuple[int, t.Any, t.Mapping[str, str]]
+
+
+class Api(t.Protocol):
+    def __call__(
+        self, method: str, path: str, query: t.Mapping[str, list[str]], body: bytes
+    ) -> Response:
+        ...
+
+
+def handler(api: Api, latency: float = 0.0) -> type[BaseHTTPRequestHandler]:
+    """Handler class that answers GET and POST requests with `api`.
+
+    String payloads are sent as plain text (e.g., Prometheus metrics), all others
+    as JSON. With `latency`, every response is delayed by that many seconds.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Headers and body are written separately, which would otherwise stall
+        # every keep-alive response until the delayed ACK of the client
+        disable_nagle_algorithm = True
+
+        def _respond(self, method: str) -> None:
+            url = urlsplit(self.path)
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length) if length else b""
+
+            if latency > 0:
+                time.sleep(latency)
+
+            status, payload, headers = api(
+                method, url.path, parse_qs(url.query), body
+            )
+
+            if isinstance(payload, str):
+                content_type = "text/plain; version=0.0.4"
+                data = payload.encode("utf-8")
+            else:
+                content_type = "application/json"
+                data = json.dumps(payload).encode("utf-8")
+
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+
+            for key, value in headers.items():
+                self.send_header(key, value)
+
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self) -> None:
+            self._respond("GET")
+
+        def do_POST(self) -> None:
+            self._respond("POST")
+
+        def log_message(self, format: str, *args: t.Any) -> None:
+            pass
+
+    return Handler
@@ -0,0 +1,64 @@
+import importlib
+import typing as t
+
+import rich_click as click
+
+
+class LazyGroup(click.RichGroup):
+    """Group that imports its subcommands only when they are invoked.
+
+    Subcommands are given as mapping from their name to a tuple of an import path
+    of the form `module:attribute` and a short help text. This keeps the startup
+    time of the CLI independent of the (heavy) dependencies of commands that are
+    not used. The help of the group shows the given texts, so it does not import
+    the subcommands either.
+    """
+
+    def __init__(
+        self,
+        *args: t.Any,
+        lazy_subcommands: t.Optional[t.Mapping[str, tuple[str, str]]] = None,
+        **kwargs: t.Any,
+    ) -> None:
+        super().__init__(*args, **kwargs)
+        self.lazy_subcommands = dict(lazy_subcommands or {})
+        self._formatting_help = False
+
+    def list_commands(self, ctx: click.Context) -> list[str]:
+        return sorted({*super().list_commands(ctx), *self.lazy_subcommands})
+
+    def format_help(self, ctx: t.Any, formatter: t.Any) -> None:
+        # rich-click looks up every subcommand to render its help text
+        self._formatting_help = True
+
+        try:
+            super().format_help(ctx, formatter)
+        finally:
+            self._formatting_help = False
+
+    def get_command(
+        self, ctx: click.Context, cmd_name: str
+    ) -> t.Optional[click.Command]:
+        if cmd_name in self.lazy_subcommands:
+            if self._formatting_help:
+                return self._placeholder(cmd_name)
+
+            return self._load(cmd_name)
+
+        return super().get_command(ctx, cmd_name)
+
+    def _placeholder(self, cmd_name: str) -> click.Command:
+        _, short_help = self.lazy_subcommands[cmd_name]
+
+        return click.RichCommand(cmd_name, short_help=short_help, help=short_help)
+
+    def _load(self, cmd_name: str) -> click.Command:
+        module_name, attr_name = self.lazy_subcommands[cmd_name][0].split(":")
+        cmd = getattr(importlib.import_module(module_name), attr_name)
+
+        if not isinstance(cmd, click.Command):
+            raise ValueError(
+                f"Lazy loading of '{module_name}:{attr_name}' failed: Not a command."
+            )
+
+        return cmd
@@ -0,0 +1,250 @@
+import asyncio
+import json
+import math
+import os
+import threading
+import time
+import typing as t
+from collections import defaultdict
+from contextlib import asynccontextmanager, contextmanager, suppress
+from pathlib import Path
+
+import attrs
+
+# Upper bounds (in seconds) of the latency histogram buckets
+LATENCY_BUCKETS: tuple[float, ...] = (
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    60,
+    math.inf,
+)
+
+
+@attrs.define
+class Histogram:
+    buckets: tuple[float, ...] = LATENCY_BUCKETS
+    counts: list[int] = attrs.field(init=False)
+    sum: float = 0.0
+    count: int = 0
+    max: float = 0.0
+
+    def __attrs_post_init__(self) -> None:
+        self.counts = [0] * len(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.sum += value
+        self.count += 1
+        self.max = max(self.max, value)
+
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def to_dict(self) -> dict[str, t.Any]:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "max": self.max,
+            "buckets": {
+                _format_bound(bound): count
+                for bound, count in zip(self.buckets, self.counts)
+            },
+        }
+
+
+@attrs.define
+class FilterCounter:
+    kept: int = 0
+    dropped: defaultdict[str, int] = attrs.field(factory=lambda: defaultdict(int))
+
+    def to_dict(self) -> dict[str, t.Any]:
+        return {"kept": self.kept, "dropped": dict(self.dropped)}
+
+
+class Metrics:
+    """Collects stage timings, filter counters and latency histograms of a run.
+
+    All methods are thread-safe so that the registry can be shared between the
+    event loop and executor threads.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.stages: defaultdict[str, Histogram] = defaultdict(Histogram)
+        self.filters: defaultdict[str, FilterCounter] = defaultdict(FilterCounter)
+        self.histograms: defaultdict[str, Histogram] = defaultdict(Histogram)
+
+    @contextmanager
+    def stage(self, name: str) -> t.Iterator[None]:
+        start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+
+            with self._lock:
+                self.stages[name].observe(duration)
+
+    def filtered(self, name: str, reason: t.Optional[str], n: int = 1) -> None:
+        """Record that `n` items were kept (`reason is None`) or dropped by a filter."""
+
+        with self._lock:
+            counter = self.filters[name]
+
+            if reason is None:
+                counter.kept += n
+            else:
+                counter.dropped[reason] += n
+
+    def observe(self, name: str, value: float) -> None:
+        with self._lock:
+            self.histograms[name].observe(value)
+
+    def to_dict(self) -> dict[str, t.Any]:
+        with self._lock:
+            return {
+                "started": self.started,
+                "duration": time.time() - self.started,
+                "stages": {key: value.to_dict() for key, value in self.stages.items()},
+                "filters": {
+                    key: value.to_dict() for key, value in self.filters.items()
+                },
+                "histograms": {
+                    key: value.to_dict() for key, value in self.histograms.items()
+                },
+            }
+
+    def write_report(self, path: Path) -> None:
+        with path.open("w") as fp:
+            json.dump(self.to_dict(), fp, indent=2)
+
+    def prometheus(self, prefix: str = "xarguebuf") -> str:
+        lines: list[str] = []
+
+        with self._lock:
+            lines.append(f"# HELP {prefix}_stage_seconds Time spent per stage.")
+            lines.append(f"# TYPE {prefix}_stage_seconds histogram")
+
+            for name, hist in self.stages.items():
+                lines.extend(
+                    _prometheus_histogram(f"{prefix}_stage_seconds", hist, stage=name)
+                )
+
+            lines.append(
+                f"# HELP {prefix}_filter_items_total Items kept or dropped by a filter."
+            )
+            lines.append(f"# TYPE {prefix}_filter_items_total counter")
+
+            for name, counter in self.filters.items():
+                lines.append(
+                    f"{prefix}_filter_items_total"
+                    f"{_labels(filter=name, outcome='kept', reason='')} {counter.kept}"
+                )
+
+                for reason, count in counter.dropped.items():
+                    lines.append(
+                        f"{prefix}_filter_items_total"
+                        f"{_labels(filter=name, outcome='dropped', reason=reason)}"
+                        f" {count}"
+                    )
+
+            for name, hist in self.histograms.items():
+                metric = f"{prefix}_{name}_seconds"
+                lines.append(f"# TYPE {metric} histogram")
+                lines.extend(_prometheus_histogram(metric, hist))
+
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: Path) -> None:
+        # The node exporter may read the file at any time, so replace it atomically
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        tmp_path.write_text(self.prometheus())
+        os.replace(tmp_path, path)
+
+
+def _format_bound(bound: float) -> str:
+    return "+Inf" if math.isinf(bound) else repr(float(bound))
+
+
+def _labels(**labels: str) -> str:
+    if not labels:
+        return ""
+
+    escaped = (
+        (key, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for key, value in labels.items()
+    )
+
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+def _prometheus_histogram(metric: str, hist: Histogram, **labels: str) -> list[str]:
+    lines: list[str] = []
+    cumulative = 0
+
+    for bound, count in zip(hist.buckets, hist.counts):
+        cumulative += count
+        bucket_labels = _labels(**labels, le=_format_bound(bound))
+        lines.append(f"{metric}_bucket{bucket_labels} {cumulative}")
+
+    lines.append(f"{metric}_sum{_labels(**labels)} {hist.sum}")
+    lines.append(f"{metric}_count{_labels(**labels)} {hist.count}")
+
+    return lines
+
+
+registry = Metrics()
+
+
+@asynccontextmanager
+async def event_loop_monitor(interval: float = 0.01) -> t.AsyncIterator[None]:
+    """Record how long the running event loop is blocked as `event_loop_stall`.
+
+    A task sleeps for `interval` seconds repeatedly, any additional delay until it
+    is resumed is time in which the loop could not serve other tasks (e.g., while
+    a synchronous function is running).
+    """
+
+    async def monitor() -> None:
+        loop = asyncio.get_running_loop()
+
+        while True:
+            start = loop.time()
+            await asyncio.sleep(interval)
+            registry.observe(
+                "event_loop_stall", max(loop.time() - start - interval, 0.0)
+            )
+
+    task = asyncio.create_task(monitor())
+
+    try:
+        yield
+    finally:
+        task.cancel()
+
+        with suppress(asyncio.CancelledError):
+            await task
+
+
+def write(output_folder: Path, prometheus_file: t.Optional[Path] = None) -> None:
+    """Store the report of the global registry next to the `config.json` file."""
+
+    registry.write_report(output_folder / "metrics.json")
+
+    if prometheus_file is not None:
+        registry.write_prometheus(prometheus_file)
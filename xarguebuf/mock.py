@@ -0,0 +1,247 @@
+"""Local HTTP servers that mimic the upstream APIs (e.g., for benchmarks)."""
+
+import re
+import threading
+import time
+import typing as t
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from http.server import ThreadingHTTPServer
+
+from xarguebuf import httpd
+from xarguebuf.httpd import Api, Response
+from xarguebuf.synthetic import HnCorpus, HnGenerator
+
+
+@contextmanager
+def serve(api: Api, latency: float = 0.0, port: int = 0) -> t.Iterator[str]:
+    """Serve `api` on localhost in a background thread and yield its base url"""
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), httpd.handler(api, latency))
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+ITEM_PATTERN = re.compile(r"^/v0/item/(\d+)\.json$")
+USER_PATTERN = re.compile(r"^/v0/user/([^/]+)\.json$")
+ENDPOINT_PATTERN = re.compile(r"^/v0/(\w+stories)\.json$")
+
+
+class Firebase:
+    """Subset of the Hacker News Firebase API backed by a corpus.
+
+    Call `churn` to simulate activity between two requests of a client, the
+    changed items are then reported by the `updates` endpoint.
+    """
+
+    def __init__(self, corpus: HnCorpus) -> None:
+        self.corpus = corpus
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.updated: list[int] = []
+
+    def reset(self, corpus: HnCorpus) -> None:
+        """Serve another corpus (e.g., a fresh copy after `churn`)"""
+
+        with self.lock:
+            self.corpus = corpus
+            self.updated = []
+
+    def churn(self, generator: HnGenerator, stories: int, comments: int) -> list[int]:
+        with self.lock:
+            self.updated = generator.churn(stories, comments)
+
+            return self.updated
+
+    def __call__(
+        self, method: str, path: str, query: t.Mapping[str, list[str]], body: bytes
+    ) -> Response:
+        with self.lock:
+            self.requests += 1
+
+            if match := ITEM_PATTERN.match(path):
+                return 200, self.corpus.items.get(int(match[1])), {}
+            if match := USER_PATTERN.match(path):
+                return 200, self.corpus.users.get(match[1]), {}
+            if ENDPOINT_PATTERN.match(path):
+                return 200, list(reversed(self.corpus.stories)), {}
+            if path == "/v0/updates.json":
+                return 200, {"items": self.updated, "profiles": []}, {}
+
+        return 404, {"error": "Permission denied"}, {}
+
+
+class RateLimit:
+    def __init__(self, requests: int, window: float) -> None:
+        self.requests = requests
+        self.window = window
+        self.used = 0
+        self.reset = time.time() + window
+
+    def __call__(self) -> tuple[bool, dict[str, str]]:
+        now = time.time()
+
+        if now >= self.reset:
+            self.used = 0
+            self.reset = now + self.window
+
+        allowed = self.used < self.requests
+
+        if allowed:
+            self.used += 1
+
+        return allowed, {
+            "x-rate-limit-limit": str(self.requests),
+            "x-rate-limit-remaining": str(self.requests - self.used),
+            "x-rate-limit-reset": str(int(self.reset)),
+        }
+
+
+class Twitter:
+    """Subset of the Twitter API v2 (lookup, full-archive search and counts)
+
+    The data is taken from the responses of a `conversations.jsonl` file (e.g.,
+    created by `synthetic.twitter_corpus`). Every endpoint enforces a rate limit of
+    `requests` per `window` seconds.
+    """
+
+    def __init__(
+        self,
+        responses: t.Iterable[t.Mapping[str, t.Any]],
+        requests: int = 300,
+        window: float = 900,
+    ) -> None:
+        self.tweets: dict[str, dict[str, t.Any]] = {}
+        self.users: dict[str, dict[str, t.Any]] = {}
+        self.conversations: defaultdict[str, list[dict[str, t.Any]]] = defaultdict(
+            list
+        )
+        self.lock = threading.Lock()
+        self.limits: defaultdict[str, RateLimit] = defaultdict(
+            lambda: RateLimit(requests, window)
+        )
+        self.requests = 0
+
+        for res in responses:
+            includes = res.get("includes", {})
+
+            for tweet in [*res.get("data", []), *includes.get("tweets", [])]:
+                self.tweets[tweet["id"]] = tweet
+
+            for user in includes.get("users", []):
+                self.users[user["id"]] = user
+
+        for tweet in self.tweets.values():
+            if tweet["conversation_id"] != tweet["id"]:
+                self.conversations[tweet["conversation_id"]].append(tweet)
+
+        for replies in self.conversations.values():
+            replies.sort(key=lambda tweet: tweet["created_at"], reverse=True)
+
+    def __call__(
+        self, method: str, path: str, query: t.Mapping[str, list[str]], body: bytes
+    ) -> Response:
+        with self.lock:
+            self.requests += 1
+            allowed, headers = self.limits[path]()
+
+            if not allowed:
+                return 429, {"title": "Too Many Requests"}, headers
+
+            if path == "/2/tweets":
+                ids = query["ids"][0].split(",")
+                data = [self.tweets[id] for id in ids if id in self.tweets]
+
+                return 200, {"data": data}, headers
+
+            if path == "/2/tweets/search/all":
+                return 200, self._search(query), headers
+
+            if path == "/2/tweets/counts/all":
+                return 200, self._counts(query), headers
+
+        return 404, {"title": "Not Found"}, {}
+
+    def _search(self, query: t.Mapping[str, list[str]]) -> dict[str, t.Any]:
+        conversation_id = query["query"][0].removeprefix("conversation_id:")
+        max_results = int(query.get("max_results", ["10"])[0])
+        offset = int(query.get("next_token", ["0"])[0])
+        replies = self.conversations.get(conversation_id, [])
+        data = replies[offset : offset + max_results]
+        meta: dict[str, t.Any] = {"result_count": len(data)}
+
+        if offset + max_results < len(replies):
+            meta["next_token"] = str(offset + max_results)
+
+        referenced = {
+            ref["id"]
+            for tweet in data
+            for ref in tweet.get("referenced_tweets", [])
+            if ref["id"] in self.tweets
+        }
+        authors = {
+            tweet["author_id"]
+            for tweet in data
+            if tweet.get("author_id") in self.users
+        }
+
+        return {
+            "data": data,
+            "includes": {
+                "tweets": [self.tweets[id] for id in sorted(referenced)],
+                "users": [self.users[id] for id in sorted(authors)],
+            },
+            "meta": meta,
+        }
+
+    def _counts(self, query: t.Mapping[str, list[str]]) -> dict[str, t.Any]:
+        # All tweets match the query, only the time range is considered
+        start = _parse_time(query["start_time"][0])
+        end = _parse_time(query["end_time"][0])
+        step = timedelta(hours=1 if query.get("granularity") == ["hour"] else 24)
+        offset = int(query.get("next_token", ["0"])[0])
+        bucket_start = start + offset * step
+        data: list[dict[str, t.Any]] = []
+
+        while bucket_start < end and len(data) < COUNTS_PAGE_SIZE:
+            bucket_end = min(bucket_start + step, end)
+            data.append(
+                {
+                    "start": _format_time(bucket_start),
+                    "end": _format_time(bucket_end),
+                    "tweet_count": sum(
+                        bucket_start <= _parse_time(tweet["created_at"]) < bucket_end
+                        for tweet in self.tweets.values()
+                    ),
+                }
+            )
+            bucket_start = bucket_end
+
+        meta: dict[str, t.Any] = {
+            "total_tweet_count": sum(bucket["tweet_count"] for bucket in data)
+        }
+
+        if bucket_start < end:
+            meta["next_token"] = str(offset + len(data))
+
+        return {"data": data, "meta": meta}
+
+
+COUNTS_PAGE_SIZE = 31
+
+
+def _parse_time(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def _format_time(value: datetime) -> str:
+    return value.strftime("%Y-%m-%dT%H:%M:%S.000Z")
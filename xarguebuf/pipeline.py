@@ -0,0 +1,261 @@
+"""Staged execution of the conversion steps shared by all platforms.
+
+A pipeline feeds the items of a source through a sequence of stages. Stages are
+connected by bounded queues, so a slow stage throttles the previous ones instead
+of accumulating items in memory. Every stage runs its function either on the
+event loop (`async`), in a thread pool (`thread`, e.g., for blocking I/O like
+gRPC calls or file writes) or in a process pool (`process`, for picklable
+CPU-bound work) with a configurable number of workers.
+
+A stage drops an item by returning `None`. Errors of single items are reported
+and counted without stopping the pipeline unless `fail_fast` is set.
+
+Stages with a `batch_size` greater than one receive a list of up to this many
+items that are already waiting (e.g., to amortize the costs of writing files)
+and return an iterable of results.
+"""
+
+import asyncio
+import threading
+import typing as t
+from concurrent import futures
+
+import attrs
+from rich import print
+
+from xarguebuf import metrics
+
+Mode = t.Literal["async", "thread", "process"]
+Source = t.Union[t.Iterable[t.Any], t.AsyncIterable[t.Any]]
+
+# Marks the end of the items in a queue
+_DONE: t.Any = object()
+
+
+@attrs.frozen
+class Stage:
+    name: str
+    func: t.Callable[[t.Any], t.Any]
+    mode: Mode = "thread"
+    concurrency: int = 1
+    batch_size: int = 1
+
+
+class Pipeline:
+    def __init__(
+        self,
+        stages: t.Sequence[Stage],
+        queue_size: int = 16,
+        fail_fast: bool = False,
+    ) -> None:
+        self.stages = list(stages)
+        self.queue_size = queue_size
+        self.fail_fast = fail_fast
+
+    def then(self, *stages: Stage) -> "Pipeline":
+        """Return a new pipeline with additional stages (e.g., a sink) at the end"""
+
+        return Pipeline([*self.stages, *stages], self.queue_size, self.fail_fast)
+
+    async def stream(self, source: Source) -> t.AsyncIterator[t.Any]:
+        """Yield the items that pass all stages (in the order they are completed)"""
+
+        queues: list[asyncio.Queue[t.Any]] = [
+            asyncio.Queue(self.queue_size) for _ in range(len(self.stages) + 1)
+        ]
+        failure: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        executors: list[futures.Executor] = []
+        tasks: list[asyncio.Task[None]] = []
+
+        def watch(task: asyncio.Task[None]) -> None:
+            if not task.cancelled() and (exc := task.exception()) is not None:
+                if not failure.done():
+                    failure.set_exception(exc)
+
+        def start(coro: t.Coroutine[t.Any, t.Any, None]) -> asyncio.Task[None]:
+            task = asyncio.create_task(coro)
+            task.add_done_callback(watch)
+            tasks.append(task)
+
+            return task
+
+        start(self._feed(source, queues[0]))
+
+        for stage, inbox, outbox in zip(self.stages, queues, queues[1:]):
+            executor = _executor(stage)
+
+            if executor is not None:
+                executors.append(executor)
+
+            workers = [
+                start(self._work(stage, executor, inbox, outbox))
+                for _ in range(max(stage.concurrency, 1))
+            ]
+            start(_close(workers, outbox))
+
+        try:
+            while (item := await _get(queues[-1], failure)) is not _DONE:
+                yield item
+
+            # Surface errors that happened after the last item
+            if failure.done():
+                failure.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+            if not failure.done():
+                failure.cancel()
+            elif not failure.cancelled():
+                # Mark the error as retrieved if the consumer stopped early
+                failure.exception()
+
+            for executor in executors:
+                executor.shutdown(wait=False, cancel_futures=True)
+
+    async def consume(self, source: Source) -> None:
+        """Run the pipeline and discard its output (i.e., the last stage is a sink)"""
+
+        async for _ in self.stream(source):
+            pass
+
+    def iterate(self, source: Source) -> t.Iterator[t.Any]:
+        """Synchronous variant of `stream` that runs the event loop in a thread"""
+
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(
+            target=loop.run_forever, name="xarguebuf-pipeline", daemon=True
+        )
+        thread.start()
+        stream = self.stream(source)
+
+        try:
+            while True:
+                try:
+                    yield asyncio.run_coroutine_threadsafe(
+                        stream.__anext__(), loop
+                    ).result()
+                except StopAsyncIteration:
+                    break
+        finally:
+            asyncio.run_coroutine_threadsafe(stream.aclose(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+
+    def run(self, source: Source) -> None:
+        for _ in self.iterate(source):
+            pass
+
+    async def _feed(self, source: Source, outbox: asyncio.Queue[t.Any]) -> None:
+        if isinstance(source, t.AsyncIterable):
+            async for item in source:
+                await outbox.put(item)
+        else:
+            # Synchronous sources (e.g., parsing a file) must not block the loop
+            iterator = iter(source)
+
+            while (item := await asyncio.to_thread(next, iterator, _DONE)) is not _DONE:
+                await outbox.put(item)
+
+        await outbox.put(_DONE)
+
+    async def _work(
+        self,
+        stage: Stage,
+        executor: t.Optional[futures.Executor],
+        inbox: asyncio.Queue[t.Any],
+        outbox: asyncio.Queue[t.Any],
+    ) -> None:
+        loop = asyncio.get_running_loop()
+
+        while (item := await inbox.get()) is not _DONE:
+            if stage.batch_size > 1:
+                item = _batch(item, inbox, stage.batch_size)
+
+            size = len(item) if stage.batch_size > 1 else 1
+
+            try:
+                if executor is None:
+                    result = await stage.func(item)
+                else:
+                    result = await loop.run_in_executor(executor, stage.func, item)
+            except Exception as e:
+                metrics.registry.filtered(f"pipeline_{stage.name}", "error", size)
+
+                if self.fail_fast:
+                    raise
+
+                print(f"Error in stage '{stage.name}', skipping {size} item(s): {e!r}")
+                continue
+
+            metrics.registry.filtered(f"pipeline_{stage.name}", None, size)
+
+            outputs = (result or []) if stage.batch_size > 1 else [result]
+
+            for output in outputs:
+                if output is not None:
+                    await outbox.put(output)
+
+        # Let the other workers of this stage see the end as well
+        await inbox.put(_DONE)
+
+
+def _batch(first: t.Any, inbox: asyncio.Queue[t.Any], size: int) -> list[t.Any]:
+    """Take up to `size` items that are waiting in the queue without blocking"""
+
+    batch = [first]
+
+    while len(batch) < size:
+        try:
+            item = inbox.get_nowait()
+        except asyncio.QueueEmpty:
+            break
+
+        if item is _DONE:
+            # The end marker is seen again by the next call of `get`
+            inbox.put_nowait(item)
+            break
+
+        batch.append(item)
+
+    return batch
+
+
+def _executor(stage: Stage) -> t.Optional[futures.Executor]:
+    if stage.mode == "thread":
+        return futures.ThreadPoolExecutor(
+            stage.concurrency, thread_name_prefix=f"xarguebuf-{stage.name}"
+        )
+    elif stage.mode == "process":
+        # Metrics recorded inside the worker processes are not transferred back
+        return futures.ProcessPoolExecutor(stage.concurrency)
+
+    return None
+
+
+async def _close(
+    workers: t.Sequence[asyncio.Task[None]], outbox: asyncio.Queue[t.Any]
+) -> None:
+    await asyncio.gather(*workers)
+    await outbox.put(_DONE)
+
+
+async def _get(queue: asyncio.Queue[t.Any], failure: asyncio.Future[None]) -> t.Any:
+    """Wait for the next item unless a stage fails before"""
+
+    getter = asyncio.ensure_future(queue.get())
+
+    try:
+        await asyncio.wait({getter, failure}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        # Also stop waiting if the consumer is cancelled
+        if not getter.done():
+            getter.cancel()
+
+    if getter.done() and not getter.cancelled():
+        return getter.result()
+
+    failure.result()
@@ -0,0 +1,205 @@
+import cProfile
+import pstats
+import sys
+import threading
+import time
+import typing as t
+from collections import Counter
+from pathlib import Path
+from types import FrameType
+
+Mode = t.Literal["cprofile", "sampling"]
+
+DEFAULT_OUTPUT: dict[str, str] = {
+    "cprofile": "xarguebuf.prof",
+    "sampling": "xarguebuf.collapsed",
+}
+
+
+class Profiler(t.Protocol):
+    def start(self) -> None:
+        ...
+
+    def stop(self) -> None:
+        ...
+
+    def dump(self, path: Path) -> None:
+        ...
+
+    def summary(self, top: int) -> None:
+        ...
+
+
+class DeterministicProfiler:
+    """Wrapper around `cProfile` that stores a `pstats` file.
+
+    Coroutines (e.g., `hn api`) are run by `asyncio.run` on the main thread, so they
+    are profiled as well. Threads started afterwards (e.g., the workers of the
+    pipeline stages) get their own profile that is merged into the result once the
+    thread has finished. Time spent waiting for I/O is attributed to the selector
+    of the event loop since the profiler measures wall-clock time.
+    """
+
+    def __init__(self, join_timeout: float = 5.0) -> None:
+        self.profile = cProfile.Profile()
+        self.join_timeout = join_timeout
+        self.thread_profiles: list[tuple[threading.Thread, cProfile.Profile]] = []
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        # Since Python 3.12, a single profile receives the events of all threads
+        if sys.version_info < (3, 12):
+            threading.setprofile(self._profile_thread)
+
+        self.profile.enable()
+
+    def _profile_thread(self, frame: FrameType, event: str, arg: t.Any) -> None:
+        # Called for the first event of a new thread, replaces itself by a profile
+        profile = cProfile.Profile()
+
+        with self._lock:
+            self.thread_profiles.append((threading.current_thread(), profile))
+
+        profile.enable()
+
+    def stop(self) -> None:
+        self.profile.disable()
+
+        if sys.version_info < (3, 12):
+            threading.setprofile(None)  # type: ignore[arg-type]
+            deadline = time.monotonic() + self.join_timeout
+
+            # A profile can only be disabled by its own thread, so its stats are
+            # only complete (and safe to read) after the thread has finished
+            for thread, _ in self._thread_profiles():
+                thread.join(max(deadline - time.monotonic(), 0))
+
+    def _thread_profiles(self) -> list[tuple[threading.Thread, cProfile.Profile]]:
+        with self._lock:
+            return list(self.thread_profiles)
+
+    def stats(self, stream: t.Optional[t.TextIO] = None) -> pstats.Stats:
+        stats = pstats.Stats(self.profile, stream=stream)
+        running = 0
+
+        for thread, profile in self._thread_profiles():
+            if thread.is_alive():
+                running += 1
+            else:
+                stats.add(profile)
+
+        if running:
+            print(
+                f"The profiles of {running} threads that are still running are"
+                " not included.",
+                file=sys.stderr,
+            )
+
+        return stats
+
+    def dump(self, path: Path) -> None:
+        self.stats().dump_stats(path)
+
+    def summary(self, top: int) -> None:
+        stats = self.stats(sys.stderr)
+        stats.strip_dirs().sort_stats(pstats.SortKey.CUMULATIVE).print_stats(top)
+
+
+class SamplingProfiler:
+    """Periodically samples the stacks of all threads.
+
+    In contrast to `cProfile`, the overhead does not depend on the number of calls
+    and executor threads are captured as well. The samples are stored in the
+    collapsed stack format understood by `flamegraph.pl` or speedscope.
+    """
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self.samples: Counter[tuple[str, ...]] = Counter()
+        self._switch_interval = sys.getswitchinterval()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="xarguebuf-profiler", daemon=True
+        )
+
+    def start(self) -> None:
+        # The sampler needs the GIL, so it must not wait longer than the interval
+        sys.setswitchinterval(min(self.interval, self._switch_interval))
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._thread.join()
+        sys.setswitchinterval(self._switch_interval)
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+
+        while not self._stopped.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own_id:
+                    stack = _collapse(frame)
+                    self.samples[(names.get(thread_id, str(thread_id)), *stack)] += 1
+
+    def dump(self, path: Path) -> None:
+        with path.open("w") as fp:
+            for stack, count in self.samples.items():
+                fp.write(f"{';'.join(stack)} {count}\n")
+
+    def summary(self, top: int) -> None:
+        total = sum(self.samples.values())
+
+        if total == 0:
+            return
+
+        own: Counter[str] = Counter()
+        cumulative: Counter[str] = Counter()
+
+        for stack, count in self.samples.items():
+            own[stack[-1]] += count
+
+            # Recursive functions shall only be counted once per sample
+            for frame in set(stack[1:]):
+                cumulative[frame] += count
+
+        print(f"{total} samples (interval: {self.interval}s)", file=sys.stderr)
+
+        for frame, count in cumulative.most_common(top):
+            share, own_share = count / total, own[frame] / total
+            print(f"{share:7.2%} total {own_share:7.2%} own  {frame}", file=sys.stderr)
+
+
+def _collapse(frame: t.Optional[FrameType]) -> list[str]:
+    stack: list[str] = []
+
+    while frame is not None:
+        code = frame.f_code
+        name = getattr(code, "co_qualname", code.co_name)
+        stack.append(f"{name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+        frame = frame.f_back
+
+    stack.reverse()
+
+    return stack
+
+
+def start(mode: Mode, output: t.Optional[Path], top: int, interval: float):
+    """Start a profiler and return a callback that stops it and stores the results"""
+
+    profiler: Profiler = (
+        DeterministicProfiler() if mode == "cprofile" else SamplingProfiler(interval)
+    )
+    path = output or Path(DEFAULT_OUTPUT[mode])
+    profiler.start()
+
+    def finish() -> None:
+        profiler.stop()
+        profiler.dump(path)
+        print(f"Profile written to '{path}'", file=sys.stderr)
+
+        if top > 0:
+            profiler.summary(top)
+
+    return finish
@@ -0,0 +1,239 @@
+"""Fast line readers for (compressed) JSONL files.
+
+All readers yield the raw `bytes` of every line since `json.loads` accepts them
+directly, saving the creation of an intermediate `str` per line.
+"""
+
+import glob
+import gzip
+import io
+import mmap
+import queue
+import shutil
+import subprocess
+import threading
+import typing as t
+from pathlib import Path
+
+GZIP_SUFFIXES = (".gz", ".gzip")
+ZSTD_SUFFIXES = (".zst", ".zstd")
+# Number of bytes decompressed per batch in the background thread
+BATCH_SIZE = 1 << 20
+# Number of batches buffered between the decompression and the consumer
+QUEUE_SIZE = 8
+
+
+def is_compressed(path: Path) -> bool:
+    return path.suffix in GZIP_SUFFIXES or path.suffix in ZSTD_SUFFIXES
+
+
+def expand_inputs(patterns: t.Iterable[str]) -> list[Path]:
+    """Resolve glob patterns (e.g., `data/*.jsonl.zst`) to a sorted list of files"""
+
+    paths: list[Path] = []
+
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            matches = sorted(glob.glob(pattern, recursive=True))
+
+            if not matches:
+                raise FileNotFoundError(f"No files match the pattern '{pattern}'.")
+
+            paths.extend(Path(match) for match in matches)
+        else:
+            path = Path(pattern)
+
+            if not path.is_file():
+                raise FileNotFoundError(f"The file '{path}' does not exist.")
+
+            paths.append(path)
+
+    # Remove duplicates (e.g., from overlapping patterns) while keeping the order
+    return list(dict.fromkeys(paths))
+
+
+def iter_lines(path: Path) -> t.Iterator[bytes]:
+    """Yield the lines of an uncompressed, gzip or zstd compressed file"""
+
+    if path.suffix in GZIP_SUFFIXES:
+        return _threaded(lambda: gzip.open(path, "rb"))
+    elif path.suffix in ZSTD_SUFFIXES:
+        return _threaded(lambda: _open_zstd(path))
+
+    return (line for _, line in iter_lines_with_offsets(path))
+
+
+def iter_lines_with_offsets(path: Path) -> t.Iterator[tuple[int, bytes]]:
+    """Yield the byte offset and content of all non-empty lines of a plain file.
+
+    The file is memory-mapped, so the operating system reads it ahead and there is
+    no buffering on the Python side.
+    """
+
+    with path.open("rb") as f:
+        # Empty files cannot be memory-mapped
+        if path.stat().st_size == 0:
+            return
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if hasattr(mmap, "MADV_SEQUENTIAL"):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+
+            start = 0
+            size = len(mm)
+
+            while start < size:
+                end = mm.find(b"\n", start)
+
+                if end == -1:
+                    end = size
+
+                if end > start:
+                    yield start, mm[start:end]
+
+                start = end + 1
+
+
+def read_lines_at(path: Path, offsets: t.Iterable[int]) -> t.Iterator[bytes]:
+    """Yield the lines starting at the given byte offsets of a plain file"""
+
+    with path.open("rb") as f:
+        for offset in sorted(offsets):
+            f.seek(offset)
+            yield f.readline()
+
+
+def _open_zstd(path: Path) -> t.BinaryIO:
+    try:
+        import zstandard
+    except ImportError:
+        zstandard = None
+
+    if zstandard is not None:
+        # zstd frames cannot be decompressed in parallel, but the library releases
+        # the GIL, so decompression overlaps with parsing in the consumer thread
+        return t.cast(
+            t.BinaryIO,
+            zstandard.ZstdDecompressor().stream_reader(
+                path.open("rb"), read_across_frames=True, closefd=True
+            ),
+        )
+
+    if executable := shutil.which("zstd"):
+        # Fall back to the command line tool, which runs in a separate process
+        proc = subprocess.Popen(
+            [executable, "--decompress", "--stdout", "--quiet", str(path)],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+
+        return t.cast(t.BinaryIO, _ProcessReader(proc, path))
+
+    raise RuntimeError(
+        f"Reading '{path}' requires either the Python package `zstandard` or the"
+        " `zstd` command line tool."
+    )
+
+
+class _ProcessReader(io.RawIOBase):
+    """Output of a decompression process that raises if the process fails.
+
+    Without checking the exit code, a corrupt or truncated archive would look like
+    a regular end of the file.
+    """
+
+    def __init__(self, proc: "subprocess.Popen[bytes]", path: Path) -> None:
+        assert proc.stdout is not None
+        self.proc = proc
+        self.path = path
+        self.stdout = proc.stdout
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: t.Any) -> int:
+        size = self.stdout.readinto(buffer)
+
+        if size == 0:
+            self._check()
+
+        return size
+
+    def _check(self) -> None:
+        if (returncode := self.proc.wait()) != 0:
+            assert self.proc.stderr is not None
+            message = self.proc.stderr.read().decode(errors="replace").strip()
+
+            raise OSError(
+                f"Decompressing '{self.path}' failed (exit code {returncode}): {message}"
+            )
+
+    def close(self) -> None:
+        if not self.closed:
+            # The consumer may stop before the end of the file
+            if self.proc.poll() is None:
+                self.proc.kill()
+
+            self.stdout.close()
+            self.proc.wait()
+
+            if self.proc.stderr is not None:
+                self.proc.stderr.close()
+
+        super().close()
+
+
+def _threaded(opener: t.Callable[[], t.BinaryIO]) -> t.Iterator[bytes]:
+    """Decompress a stream in a background thread and yield its lines.
+
+    The bounded queue limits the memory usage if the consumer is slower than the
+    decompression.
+    """
+
+    batches: queue.Queue[t.Union[list[bytes], BaseException, None]] = queue.Queue(
+        QUEUE_SIZE
+    )
+    stopped = threading.Event()
+
+    def produce() -> None:
+        try:
+            with opener() as f:
+                buffered = _buffered(f)
+
+                while not stopped.is_set():
+                    if not (batch := buffered.readlines(BATCH_SIZE)):
+                        break
+
+                    batches.put(batch)
+        except BaseException as e:
+            batches.put(e)
+        else:
+            batches.put(None)
+
+    thread = threading.Thread(target=produce, name="xarguebuf-reader", daemon=True)
+    thread.start()
+
+    try:
+        while (batch := batches.get()) is not None:
+            if isinstance(batch, BaseException):
+                raise batch
+
+            yield from (line for line in batch if not line.isspace())
+    finally:
+        # Unblock the producer if the consumer stops early
+        stopped.set()
+
+        while thread.is_alive():
+            try:
+                batches.get_nowait()
+            except queue.Empty:
+                thread.join(0.1)
+
+
+def _buffered(f: t.BinaryIO) -> t.IO[bytes]:
+    # The stream reader of zstandard is unbuffered, so reading lines from it
+    # directly would be slow
+    if isinstance(f, (io.BufferedReader, gzip.GzipFile)):
+        return f
+
+    return io.BufferedReader(t.cast(t.Any, f), BATCH_SIZE)
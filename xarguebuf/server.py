@@ -0,0 +1,498 @@
+"""Long-running HTTP service that converts Twitter payloads and HN stories.
+
+In contrast to the one-shot commands, the imports, the entailment channel, the
+HTTP connection pool for Hacker News and the worker threads are set up once and
+shared by all requests. HN stories are crawled on a single event loop, while the
+graphs of both platforms are built by the worker threads.
+"""
+
+import asyncio
+import functools
+import hashlib
+import json
+import threading
+import time
+import typing as t
+from collections import OrderedDict
+from concurrent import futures
+from http.server import ThreadingHTTPServer
+
+import arguebuf
+import attrs
+import httpx
+import rich_click as click
+import typed_settings as ts
+from rich import print
+
+from xarguebuf import common, httpd, metrics
+from xarguebuf.hn import api as hn_api
+from xarguebuf.twitter import convert as twitter_convert
+
+
+@ts.settings(frozen=True)
+class TwitterConfig:
+    graph: common.GraphFilterConfig = common.GraphFilterConfig()
+    tweet: twitter_convert.TweetConfig = twitter_convert.TweetConfig()
+
+    def convert_config(self) -> twitter_convert.Config:
+        return twitter_convert.Config(
+            graph=common.GraphConfig(**attrs.asdict(self.graph)), tweet=self.tweet
+        )
+
+
+@ts.settings(frozen=True)
+class HnConfig:
+    graph: common.GraphFilterConfig = common.GraphFilterConfig()
+    comment: hn_api.CommentConfig = hn_api.CommentConfig()
+    story: hn_api.StoryConfig = hn_api.StoryConfig()
+    base_url: str = ts.option(
+        default=hn_api.EndpointConfig().base_url,
+        help="Base url of the Hacker News API (e.g., to use a local mirror).",
+    )
+    concurrency: int = ts.option(
+        default=4, help="Number of stories of a request that are crawled concurrently."
+    )
+
+    def api_config(self, entailment_address: t.Optional[str]) -> hn_api.Config:
+        return hn_api.Config(
+            graph=common.GraphConfig(**attrs.asdict(self.graph)),
+            comment=self.comment,
+            story=self.story,
+            endpoint=hn_api.EndpointConfig(base_url=self.base_url),
+            entailment_address=entailment_address,
+            concurrency=self.concurrency,
+        )
+
+
+@ts.settings(frozen=True)
+class Config:
+    twitter: TwitterConfig = TwitterConfig()
+    hn: HnConfig = HnConfig()
+    entailment_address: t.Optional[str] = ts.option(
+        default=None,
+        help="Address of the entailment service used to predict the schemes.",
+    )
+    host: str = ts.option(default="127.0.0.1", help="Interface to listen on.")
+    port: int = ts.option(default=8000, help="Port to listen on.")
+    workers: int = ts.option(
+        default=4, help="Number of threads that convert requests concurrently."
+    )
+    max_requests: int = ts.option(
+        default=16,
+        help=(
+            "Requests that may be processed or queued at the same time. Further"
+            " requests are rejected with status 503."
+        ),
+    )
+    timeout: float = ts.option(
+        default=300, help="Seconds after which a request is aborted."
+    )
+    cache_size: int = ts.option(
+        default=1024, help="Number of results kept in memory (0 disables caching)."
+    )
+    cache_ttl: float = ts.option(
+        default=600,
+        help="Seconds a cached result is valid (HN stories may receive new comments).",
+    )
+
+
+class InvalidRequest(Exception):
+    """The parameters or the body of a request are malformed"""
+
+
+class StoryError(Exception):
+    """A single story of a request could not be converted"""
+
+    def __init__(self, id: int, status: int, message: str) -> None:
+        super().__init__(message)
+        self.id = id
+        self.status = status
+
+    def to_dict(self) -> dict[str, t.Any]:
+        return {"id": self.id, "status": self.status, "error": str(self)}
+
+
+class RequestTimeout(Exception):
+    """The result of a request is not available in time.
+
+    `future` is done once the work of the request has actually stopped.
+    """
+
+    def __init__(self, future: futures.Future[t.Any]) -> None:
+        super().__init__()
+        self.future = future
+
+
+class Cache:
+    """Thread-safe LRU cache whose entries expire after `ttl` seconds"""
+
+    def __init__(self, size: int, ttl: float) -> None:
+        self.size = size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[t.Hashable, tuple[float, t.Any]] = OrderedDict()
+
+    def get(self, key: t.Hashable) -> t.Optional[t.Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                metrics.registry.filtered("cache", "miss")
+                return None
+
+            expires, value = entry
+
+            if expires < time.monotonic():
+                del self._entries[key]
+                metrics.registry.filtered("cache", "expired")
+                return None
+
+            self._entries.move_to_end(key)
+            metrics.registry.filtered("cache", None)
+
+            return value
+
+    def set(self, key: t.Hashable, value: t.Any) -> None:
+        if self.size <= 0:
+            return
+
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+
+class Service:
+    """Holds the warm resources and converts single requests"""
+
+    def __init__(self, config: Config) -> None:
+        self.config = config
+        self.twitter_config = config.twitter.convert_config()
+        self.hn_config = config.hn.api_config(config.entailment_address)
+        self.cache = Cache(config.cache_size, config.cache_ttl)
+        self.slots = threading.BoundedSemaphore(config.max_requests)
+        self.executor = futures.ThreadPoolExecutor(
+            config.workers, thread_name_prefix="xarguebuf-worker"
+        )
+        # grpc channels are thread-safe, so a single one is shared by all workers and
+        # used for both platforms
+        self.entailment_client = common.entailment_client(config.entailment_address)
+        self.loop = asyncio.new_event_loop()
+        self.loop_thread = threading.Thread(
+            target=self.loop.run_forever, name="xarguebuf-loop", daemon=True
+        )
+        self.loop_thread.start()
+        self.http_client: httpx.AsyncClient = asyncio.run_coroutine_threadsafe(
+            self._create_http_client(), self.loop
+        ).result()
+
+        # Start all worker threads now instead of during the first requests
+        for future in [
+            self.executor.submit(time.sleep, 0) for _ in range(config.workers)
+        ]:
+            future.result()
+
+    async def _create_http_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            base_url=self.hn_config.endpoint.base_url,
+            limits=httpx.Limits(max_connections=self.config.max_requests * 4),
+        )
+
+    def _run(
+        self,
+        func: t.Callable[
+            [list[futures.Future[t.Any]]], t.Coroutine[t.Any, t.Any, t.Any]
+        ],
+    ) -> t.Any:
+        """Run `func(jobs)` on the event loop and wait for its result.
+
+        The coroutine has to append the futures of the work it submits to the
+        executor to `jobs`. These cannot be cancelled once they run, so a timed out
+        request only stops after them.
+        """
+
+        jobs: list[futures.Future[t.Any]] = []
+        stopped: futures.Future[None] = futures.Future()
+
+        async def run() -> t.Any:
+            # The timeout is enforced on the loop, so that the coroutine has always
+            # finished (or been cancelled) when `run` returns
+            try:
+                return await asyncio.wait_for(func(jobs), self.config.timeout)
+            except asyncio.TimeoutError:
+                raise RequestTimeout(stopped) from None
+            finally:
+                _set_when_done(jobs, stopped)
+
+        return asyncio.run_coroutine_threadsafe(run(), self.loop).result()
+
+    def _wait(self, future: futures.Future[t.Any]) -> t.Any:
+        try:
+            return future.result(self.config.timeout)
+        except futures.TimeoutError:
+            # Queued jobs are cancelled, running ones finish
+            future.cancel()
+            raise RequestTimeout(future)
+
+    def close(self) -> None:
+        asyncio.run_coroutine_threadsafe(self.http_client.aclose(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.loop_thread.join()
+        self.executor.shutdown()
+
+    def twitter_graphs(self, body: bytes, grouped: bool) -> list[dict[str, t.Any]]:
+        key = ("twitter", grouped, hashlib.sha256(body).hexdigest())
+
+        if (graphs := self.cache.get(key)) is None:
+            graphs = self._wait(
+                self.executor.submit(self._convert_tweets, body.splitlines(), grouped)
+            )
+            self.cache.set(key, graphs)
+
+        return graphs
+
+    def _convert_tweets(
+        self, lines: list[bytes], grouped: bool
+    ) -> list[dict[str, t.Any]]:
+        # The stages run one after another in the worker thread of the request instead
+        # of a pipeline with its own threads. Concurrent requests must not show
+        # progress bars, rich allows only one.
+        graphs: list[dict[str, t.Any]] = []
+        conversations = twitter_convert.iter_conversations(
+            (line for line in lines if line.strip()), grouped, progress=False
+        )
+
+        try:
+            for conversation in conversations:
+                try:
+                    if g := twitter_convert.build_graph(
+                        conversation, self.twitter_config
+                    ):
+                        graphs.append(self._dump(g))
+                except Exception as e:
+                    # Like in the batch command, single conversations must not fail
+                    # all
+                    metrics.registry.filtered("conversation", "error")
+                    print(f"Error in conversation {conversation[0]['id']}: {e!r}")
+        except json.JSONDecodeError as e:
+            raise InvalidRequest(f"The body contains invalid JSON: {e}") from e
+
+        return graphs
+
+    def _dump(self, g: arguebuf.Graph) -> dict[str, t.Any]:
+        common.predict_schemes(g, client=self.entailment_client)
+
+        return arguebuf.dump.dict(g)
+
+    def hn_graphs(
+        self, ids: t.Sequence[int]
+    ) -> tuple[list[dict[str, t.Any]], list[StoryError]]:
+        """Return the graphs of all stories and the errors of those that failed"""
+
+        # Stories that do not pass the filters are cached as empty lists
+        results: dict[int, t.Union[list[t.Any], StoryError, None]] = {
+            id: self.cache.get(("hn", id)) for id in ids
+        }
+
+        if missing := [id for id, graphs in results.items() if graphs is None]:
+            crawl = functools.partial(self._crawl_stories, missing)
+
+            for id, result in self._run(crawl).items():
+                if not isinstance(result, StoryError):
+                    self.cache.set(("hn", id), result)
+
+                results[id] = result
+
+        graphs: list[dict[str, t.Any]] = []
+        errors: list[StoryError] = []
+
+        for result in results.values():
+            if isinstance(result, StoryError):
+                errors.append(result)
+            else:
+                graphs.extend(result or [])
+
+        return graphs, errors
+
+    async def _crawl_stories(
+        self, ids: list[int], jobs: list[futures.Future[t.Any]]
+    ) -> dict[int, t.Union[list[t.Any], StoryError]]:
+        # Comment ids are resolved to their story, so every id is crawled separately
+        # to return the results of the requested ids
+        slots = asyncio.Semaphore(self.hn_config.concurrency)
+
+        async def crawl(id: int) -> t.Union[list[t.Any], StoryError]:
+            # Like conversations, single stories must not fail the whole request
+            try:
+                async with slots:
+                    discussion = await hn_api.fetch_discussion(
+                        id, self.hn_config, self.http_client
+                    )
+            except hn_api.ItemNotFound as e:
+                metrics.registry.filtered("story", "not_found")
+                return StoryError(id, 404, str(e))
+            except Exception as e:
+                metrics.registry.filtered("story", "upstream_error")
+                print(f"Error when crawling story {id}: {e!r}")
+                return StoryError(id, 502, f"The Hacker News API failed: {e!r}")
+
+            if discussion is None:
+                return []
+
+            jobs.append(self.executor.submit(self._convert_discussion, discussion))
+
+            try:
+                return await asyncio.wrap_future(jobs[-1])
+            except Exception as e:
+                metrics.registry.filtered("story", "error")
+                print(f"Error in story {id}: {e!r}")
+                return StoryError(id, 500, str(e))
+
+        return dict(zip(ids, await asyncio.gather(*(crawl(id) for id in ids))))
+
+    def _convert_discussion(self, discussion: hn_api.Discussion) -> list[t.Any]:
+        if g := hn_api.build_graph(discussion, self.hn_config):
+            return [self._dump(g)]
+
+        return []
+
+    def __call__(
+        self, method: str, path: str, query: t.Mapping[str, list[str]], body: bytes
+    ) -> httpd.Response:
+        if method == "GET" and path == "/health":
+            return 200, {"status": "ok"}, {}
+        if method == "GET" and path == "/metrics":
+            return 200, metrics.registry.prometheus(), {}
+
+        if not self.slots.acquire(blocking=False):
+            metrics.registry.filtered("request", "overloaded")
+            return 503, {"error": "Too many concurrent requests."}, {"Retry-After": "1"}
+
+        start = time.perf_counter()
+        release = True
+        ids: list[int] = []
+        errors: t.Optional[list[StoryError]] = None
+
+        try:
+            if method == "POST" and path == "/twitter/graphs":
+                graphs = self.twitter_graphs(body, _parse_grouped(query))
+            elif path == "/hn/graphs":
+                ids = _parse_ids(query, body if method == "POST" else b"")
+                graphs, errors = self.hn_graphs(ids)
+            else:
+                return 404, {"error": f"Unknown endpoint '{method} {path}'."}, {}
+        except InvalidRequest as e:
+            metrics.registry.filtered("request", "invalid")
+            return 400, {"error": f"Invalid request: {e}"}, {}
+        except RequestTimeout as e:
+            # The slot is kept until the work has actually stopped, so that
+            # `max_requests` still bounds the load
+            release = False
+            e.future.add_done_callback(lambda _: self.slots.release())
+            metrics.registry.filtered("request", "timeout")
+            return 504, {"error": "The request timed out."}, {}
+        except Exception as e:
+            metrics.registry.filtered("request", "error")
+            print(f"Error when processing '{method} {path}': {e!r}")
+            return 500, {"error": str(e)}, {}
+        finally:
+            if release:
+                self.slots.release()
+
+        metrics.registry.observe("request_latency", time.perf_counter() - start)
+
+        if errors is None:
+            metrics.registry.filtered("request", None)
+            return 200, {"graphs": graphs}, {}
+
+        payload = {"graphs": graphs, "errors": [e.to_dict() for e in errors]}
+
+        # Partial results are returned, the request only fails if no story succeeded
+        if errors and len(errors) == len(set(ids)):
+            statuses = {e.status for e in errors}
+            status = statuses.pop() if len(statuses) == 1 else 502
+            metrics.registry.filtered(
+                "request", "not_found" if status == 404 else "error"
+            )
+            return status, payload, {}
+
+        metrics.registry.filtered("request", None)
+
+        return 200, payload, {}
+
+
+def _set_when_done(
+    jobs: t.Sequence[futures.Future[t.Any]], future: futures.Future[None]
+) -> None:
+    """Complete `future` once all jobs are done (in the thread of the last one)"""
+
+    if pending := [job for job in jobs if not job.done()]:
+        pending[0].add_done_callback(lambda _: _set_when_done(pending[1:], future))
+    else:
+        future.set_result(None)
+
+
+def _parse_grouped(query: t.Mapping[str, list[str]]) -> bool:
+    value = query.get("grouped", ["false"])[0].lower()
+
+    if value not in ("true", "false"):
+        raise InvalidRequest(f"'grouped' must be 'true' or 'false', not '{value}'.")
+
+    return value == "true"
+
+
+def _parse_ids(query: t.Mapping[str, list[str]], body: bytes) -> list[int]:
+    """Read the story ids from the query or the JSON body of a request"""
+
+    values: t.Any = query.get("id", [])
+
+    if body:
+        try:
+            payload = json.loads(body)
+        except json.JSONDecodeError as e:
+            raise InvalidRequest(f"The body contains invalid JSON: {e}") from e
+
+        values = payload.get("ids", []) if isinstance(payload, dict) else None
+
+        if not isinstance(values, list):
+            raise InvalidRequest('The body must be an object like {"ids": [...]}.')
+
+    ids: list[int] = []
+
+    for value in values:
+        if isinstance(value, str) and value.isascii() and value.isdigit():
+            ids.append(int(value))
+        elif isinstance(value, int) and not isinstance(value, bool) and value >= 0:
+            ids.append(value)
+        else:
+            raise InvalidRequest(f"Invalid story id {value!r}.")
+
+    return ids
+
+
+@click.command("start")
+@ts.click_options(Config, "xarguebuf.server")
+def serve(config: Config):
+    """Serve the conversion of Twitter payloads and HN stories over HTTP
+
+    `POST /twitter/graphs` accepts the lines of a `conversations.jsonl` file as
+    body, `GET /hn/graphs?id=...` (or `POST` with `{"ids": [...]}`) crawls the
+    given stories. Both return `{"graphs": [...]}` in the arguebuf format, the HN
+    endpoint additionally lists the stories that failed as `errors`.
+    `GET /metrics` exposes the metrics in the Prometheus text format.
+    """
+
+    service = Service(config)
+    server = ThreadingHTTPServer((config.host, config.port), httpd.handler(service))
+    server.daemon_threads = True
+    print(f"Listening on http://{config.host}:{server.server_address[1]}")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
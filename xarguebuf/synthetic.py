@@ -0,0 +1,364 @@
+"""Generators for synthetic Twitter and Hacker News corpora.
+
+The generated data mimics the shape of the real APIs closely enough to exercise the
+complete conversion pipelines (e.g., for benchmarks or mock servers).
+"""
+
+import itertools
+import json
+import math
+import random
+import string
+import time
+import typing as t
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import attrs
+import typed_settings as ts
+
+WORDS = (
+    "the of and to in is that for it as was with be by on not he this are or his"
+    " from at which but have an they you were her she there been one all we their"
+    " has would when if so no will more can about said what out up them some could"
+    " time into only do like then than other these two may first new any should"
+    " people vote election debate policy president economy health care support"
+    " agree disagree because evidence source claim argument reason believe think"
+).split()
+DEFAULT_LANGUAGES = ("en:0.85", "es:0.1", "de:0.05")
+
+
+@ts.settings(frozen=True)
+class CorpusConfig:
+    conversations: int = ts.option(
+        default=100,
+        help="Number of conversations (Twitter) or stories (Hacker News).",
+    )
+    fanout: float = ts.option(
+        default=2.0,
+        help="Mean number of direct replies per post (Poisson distributed).",
+    )
+    root_fanout: float = ts.option(
+        default=8.0,
+        help="Mean number of direct replies to the start of a conversation.",
+    )
+    max_depth: int = ts.option(default=8, help="Maximum length of a reply chain.")
+    depth_decay: float = ts.option(
+        default=0.6,
+        help="Factor the fan-out is multiplied with on every additional level.",
+    )
+    languages: t.List[str] = ts.option(
+        factory=lambda: list(DEFAULT_LANGUAGES),
+        help="Languages of the tweets and their relative frequency (`lang:weight`).",
+    )
+    min_words: int = ts.option(default=3, help="Minimum number of words per post.")
+    max_words: int = ts.option(default=60, help="Maximum number of words per post.")
+    users: int = ts.option(default=1000, help="Number of distinct authors.")
+    page_size: int = ts.option(
+        default=500,
+        help="Maximum number of tweets per response (like the full-archive search).",
+    )
+    seed: int = ts.option(default=0, help="Seed of the random number generator.")
+
+
+class _Generator:
+    def __init__(self, config: CorpusConfig) -> None:
+        self.config = config
+        self.random = random.Random(config.seed)
+        self.ids = itertools.count(1_200_000_000_000_000_000)
+        self.start = datetime(2020, 2, 3, tzinfo=timezone.utc)
+        self.languages: list[str] = []
+        self.language_weights: list[float] = []
+
+        # An empty list (e.g., if no option has been passed) uses the defaults
+        for entry in config.languages or DEFAULT_LANGUAGES:
+            language, _, weight = entry.partition(":")
+            self.languages.append(language)
+            self.language_weights.append(float(weight or 1))
+
+    def next_id(self) -> str:
+        return str(next(self.ids))
+
+    def poisson(self, mean: float) -> int:
+        # Knuth's algorithm, sufficient for the small means used here
+        limit = math.exp(-mean)
+        k, p = 0, 1.0
+
+        while True:
+            p *= self.random.random()
+
+            if p <= limit:
+                return k
+
+            k += 1
+
+    def text(self) -> str:
+        length = self.random.randint(self.config.min_words, self.config.max_words)
+
+        return " ".join(self.random.choices(WORDS, k=length)).capitalize() + "."
+
+    def user_id(self) -> int:
+        return self.random.randrange(self.config.users)
+
+    def timestamp(self, offset: timedelta = timedelta()) -> datetime:
+        return (
+            self.start
+            + timedelta(seconds=self.random.randrange(60 * 60 * 24 * 270))
+            + offset
+        )
+
+    def tree(self, parent: t.Any, level: int, make: t.Callable[[t.Any, int], t.Any]):
+        """Recursively create replies to `parent` by calling `make`"""
+
+        if level > self.config.max_depth:
+            return
+
+        mean = (
+            self.config.root_fanout
+            if level == 1
+            else self.config.fanout * self.config.depth_decay ** (level - 2)
+        )
+
+        for _ in range(self.poisson(mean)):
+            child = make(parent, level)
+            self.tree(child, level + 1, make)
+
+
+def twitter_user(gen: _Generator, user_id: int) -> dict[str, t.Any]:
+    return {
+        "id": str(user_id),
+        "name": f"User {user_id}",
+        "username": f"user{user_id}",
+        "created_at": "2010-01-01T00:00:00.000Z",
+        "description": gen.text(),
+        "verified": user_id % 10 == 0,
+    }
+
+
+def twitter_tweet(
+    gen: _Generator,
+    conversation_id: t.Optional[str],
+    parent: t.Optional[t.Mapping[str, t.Any]],
+    created_at: datetime,
+) -> dict[str, t.Any]:
+    tweet_id = gen.next_id()
+    text = gen.text()
+
+    if parent is not None:
+        text = f"@user{parent['author_id']} {text}"
+
+    if gen.random.random() < 0.2:
+        slug = "".join(gen.random.choices(string.ascii_letters, k=10))
+        text = f"{text} https://t.co/{slug}"
+
+    tweet: dict[str, t.Any] = {
+        "id": tweet_id,
+        "conversation_id": conversation_id or tweet_id,
+        "author_id": str(gen.user_id()),
+        "created_at": created_at.isoformat(timespec="milliseconds").replace(
+            "+00:00", "Z"
+        ),
+        "text": text,
+        "lang": gen.random.choices(gen.languages, gen.language_weights)[0],
+        "public_metrics": {
+            "like_count": gen.poisson(1.5),
+            "reply_count": gen.poisson(0.5),
+            "quote_count": gen.poisson(0.1),
+            "retweet_count": gen.poisson(0.3),
+        },
+        "source": "Twitter Web App",
+    }
+
+    if parent is not None:
+        tweet["referenced_tweets"] = [{"type": "replied_to", "id": parent["id"]}]
+
+    return tweet
+
+
+def twitter_conversation(gen: _Generator) -> list[dict[str, t.Any]]:
+    """Create the search responses (pages) of a single conversation"""
+
+    root_time = gen.timestamp()
+    root = twitter_tweet(gen, None, None, root_time)
+    replies: list[dict[str, t.Any]] = []
+
+    def make(parent: dict[str, t.Any], level: int) -> dict[str, t.Any]:
+        created_at = root_time + timedelta(minutes=gen.random.randrange(60 * level))
+        reply = twitter_tweet(gen, root["id"], parent, created_at)
+        replies.append(reply)
+
+        return reply
+
+    gen.tree(root, 1, make)
+
+    tweets = {tweet["id"]: tweet for tweet in [root, *replies]}
+    pages: list[dict[str, t.Any]] = []
+
+    # The search endpoint returns the newest tweets first
+    replies.sort(key=lambda tweet: tweet["created_at"], reverse=True)
+
+    for i in range(0, max(len(replies), 1), gen.config.page_size):
+        data = replies[i : i + gen.config.page_size]
+        referenced = {
+            ref["id"]
+            for tweet in data
+            for ref in tweet.get("referenced_tweets", [])
+            if ref["id"] in tweets
+        }
+        referenced.add(root["id"])
+        author_ids = {tweet["author_id"] for tweet in data} | {root["author_id"]}
+
+        pages.append(
+            {
+                "data": data,
+                "includes": {
+                    "tweets": [tweets[tweet_id] for tweet_id in sorted(referenced)],
+                    "users": [
+                        twitter_user(gen, int(author_id))
+                        for author_id in sorted(author_ids)
+                    ],
+                },
+                "meta": {"result_count": len(data)},
+            }
+        )
+
+    return pages
+
+
+def twitter_corpus(config: CorpusConfig) -> t.Iterator[dict[str, t.Any]]:
+    """Yield the response lines of a `conversations.jsonl` file"""
+
+    gen = _Generator(config)
+
+    for _ in range(config.conversations):
+        yield from twitter_conversation(gen)
+
+
+def write_twitter_corpus(path: Path, config: CorpusConfig) -> None:
+    with path.open("w", encoding="utf-8") as fp:
+        for response in twitter_corpus(config):
+            fp.write(json.dumps(response))
+            fp.write("\n")
+
+
+@attrs.define
+class HnCorpus:
+    items: dict[int, dict[str, t.Any]] = attrs.field(factory=dict)
+    users: dict[str, dict[str, t.Any]] = attrs.field(factory=dict)
+    stories: list[int] = attrs.field(factory=list)
+
+    def to_dict(self) -> dict[str, t.Any]:
+        return {"items": self.items, "users": self.users, "stories": self.stories}
+
+
+class HnGenerator:
+    """Creates Hacker News items and adds them to a corpus"""
+
+    def __init__(self, config: CorpusConfig, corpus: t.Optional[HnCorpus] = None):
+        self.gen = _Generator(config)
+        self.corpus = corpus or HnCorpus()
+        self.ids = itertools.count(max(self.corpus.items, default=30_000_000 - 1) + 1)
+
+    def user(self, user_id: int) -> str:
+        name = f"user{user_id}"
+
+        if name not in self.corpus.users:
+            self.corpus.users[name] = {
+                "id": name,
+                "created": 1_300_000_000 + user_id,
+                "karma": self.gen.random.randrange(10_000),
+                "about": f"<p>{self.gen.text()}</p>",
+                "submitted": [],
+            }
+
+        return name
+
+    def add_item(self, item: dict[str, t.Any]) -> dict[str, t.Any]:
+        self.corpus.items[item["id"]] = item
+        self.corpus.users[item["by"]]["submitted"].append(item["id"])
+
+        if parent_id := item.get("parent"):
+            self.corpus.items[parent_id].setdefault("kids", []).append(item["id"])
+
+        return item
+
+    def comment(self, parent: dict[str, t.Any], level: int) -> dict[str, t.Any]:
+        text = self.gen.text()
+
+        if self.gen.random.random() < 0.3:
+            text = f"{text}<p>{self.gen.text()}"
+
+        return self.add_item(
+            {
+                "id": next(self.ids),
+                "type": "comment",
+                "by": self.user(self.gen.user_id()),
+                "time": parent["time"] + self.gen.random.randrange(60 * 60 * level),
+                "text": text,
+                "parent": parent["id"],
+            }
+        )
+
+    def story(self, created: t.Optional[int] = None, replies: bool = True) -> int:
+        story = self.add_item(
+            {
+                "id": next(self.ids),
+                "type": "story",
+                "by": self.user(self.gen.user_id()),
+                "time": created or int(self.gen.timestamp().timestamp()),
+                "title": self.gen.text()[:80],
+                "url": "https://example.com",
+                "score": self.gen.random.randrange(500),
+                "descendants": 0,
+            }
+        )
+
+        if replies:
+            before = len(self.corpus.items)
+            self.gen.tree(story, 1, self.comment)
+            story["descendants"] = len(self.corpus.items) - before
+
+        self.corpus.stories.append(story["id"])
+
+        return story["id"]
+
+    def churn(self, stories: int, comments: int, window: int = 50) -> list[int]:
+        """Simulate activity: post new stories and reply to the latest `window` ones.
+
+        Returns the ids of all new and modified items like the `updates` endpoint.
+        """
+
+        changed: set[int] = set()
+        now = int(time.time())
+
+        for _ in range(stories):
+            changed.add(self.story(now, replies=False))
+
+        recent = self.corpus.stories[-window:]
+
+        for _ in range(comments):
+            story = self.corpus.items[self.gen.random.choice(recent)]
+            parent, level = story, 1
+
+            # Descend into a random branch to also create nested replies
+            while (kids := parent.get("kids")) and self.gen.random.random() < 0.6:
+                parent = self.corpus.items[self.gen.random.choice(kids)]
+                level += 1
+
+            comment = self.comment(parent, level)
+            story["descendants"] += 1
+            story["score"] += self.gen.random.randrange(3)
+            changed.update((comment["id"], parent["id"], story["id"]))
+
+        return sorted(changed)
+
+
+def hn_corpus(config: CorpusConfig) -> HnCorpus:
+    """Create a Hacker News item tree as returned by the Firebase API"""
+
+    generator = HnGenerator(config)
+
+    for _ in range(config.conversations):
+        generator.story()
+
+    return generator.corpus
@@ -1,5 +1,45 @@
-import rich_click as click
+import typing as t
 
-from . import api, convert, count
+from xarguebuf.lazy import LazyGroup
 
-cli = click.CommandCollection(name="twitter", sources=[convert.cli, count.cli, api.cli])
+if t.TYPE_CHECKING:
+    from .convert import Config, TweetConfig, iter_graphs
+
+__all__ = ["Config", "TweetConfig", "iter_graphs", "cli"]
+
+cli = LazyGroup(
+    name="twitter",
+    lazy_subcommands={
+        "api": ("twarc.command2:twarc2", "Collect data from the Twitter V2 API."),
+        "convert": (
+            "xarguebuf.twitter.convert:convert",
+            "Convert INPUT_FILES (.jsonl) to argument graphs.",
+        ),
+        "count": (
+            "xarguebuf.twitter.count:count",
+            "Count the tweets matching QUERY in concurrent windows.",
+        ),
+        "download": (
+            "xarguebuf.twitter.download:download",
+            "Download the conversations of all tweets in TWEET_IDS.",
+        ),
+        "index": (
+            "xarguebuf.twitter.index:index",
+            "Index the lines of INPUT_FILE (.jsonl) by conversation id.",
+        ),
+        "sweep": (
+            "xarguebuf.twitter.sweep:sweep",
+            "Evaluate combinations of filter options on INPUT_FILES (.jsonl).",
+        ),
+    },
+)
+
+
+def __getattr__(name: str) -> t.Any:
+    # The library API is imported on first access to keep the CLI startup fast
+    if name in ("Config", "TweetConfig", "iter_graphs"):
+        from . import convert
+
+        return getattr(convert, name)
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
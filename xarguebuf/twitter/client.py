@@ -0,0 +1,179 @@
+import asyncio
+import time
+import typing as t
+
+from rich import print
+
+from xarguebuf import metrics
+
+# httpx is imported lazily to keep the startup of the CLI fast
+if t.TYPE_CHECKING:
+    import httpx
+
+API_URL = "https://api.twitter.com/2/"
+
+TWEET_FIELDS = ",".join(
+    [
+        "attachments",
+        "author_id",
+        "context_annotations",
+        "conversation_id",
+        "created_at",
+        "entities",
+        "geo",
+        "id",
+        "in_reply_to_user_id",
+        "lang",
+        "possibly_sensitive",
+        "public_metrics",
+        "referenced_tweets",
+        "reply_settings",
+        "source",
+        "text",
+        "withheld",
+    ]
+)
+USER_FIELDS = ",".join(
+    [
+        "created_at",
+        "description",
+        "entities",
+        "id",
+        "location",
+        "name",
+        "pinned_tweet_id",
+        "profile_image_url",
+        "protected",
+        "public_metrics",
+        "url",
+        "username",
+        "verified",
+        "withheld",
+    ]
+)
+EXPANSIONS = ",".join(
+    [
+        "author_id",
+        "entities.mentions.username",
+        "in_reply_to_user_id",
+        "referenced_tweets.id",
+        "referenced_tweets.id.author_id",
+    ]
+)
+
+
+class RateLimiter:
+    """Schedules requests to a single endpoint within its rate limit.
+
+    The Twitter API grants a fixed number of requests per 15 minute window. The
+    limiter starts with the documented limit and synchronizes itself with the
+    `x-rate-limit-*` headers of every response. Some endpoints additionally
+    require a minimum interval between two requests.
+    """
+
+    def __init__(self, requests: int, window: float = 900, interval: float = 0):
+        self.requests = requests
+        self.window = window
+        self.interval = interval
+        self.remaining = requests
+        self.reset = time.monotonic() + window
+        self.last_request = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            now = time.monotonic()
+
+            if now >= self.reset:
+                self.remaining = self.requests
+                self.reset = now + self.window
+
+            if self.remaining <= 0:
+                delay = self.reset - now
+                print(f"Rate limit exhausted, waiting {delay:.0f}s...")
+
+                with metrics.registry.stage("rate_limit"):
+                    await asyncio.sleep(delay)
+
+                self.remaining = self.requests
+                self.reset = time.monotonic() + self.window
+
+            if (delay := self.last_request + self.interval - time.monotonic()) > 0:
+                await asyncio.sleep(delay)
+
+            self.remaining -= 1
+            self.last_request = time.monotonic()
+
+    def update(self, response: "httpx.Response") -> None:
+        remaining = response.headers.get("x-rate-limit-remaining")
+        reset = response.headers.get("x-rate-limit-reset")
+
+        if remaining is not None:
+            self.remaining = min(self.remaining, int(remaining))
+
+        if response.status_code == 429:
+            self.remaining = 0
+
+        if reset is not None:
+            # The header contains the epoch time, convert it to the monotonic clock
+            self.reset = time.monotonic() + max(float(reset) - time.time(), 0)
+
+
+class Client:
+    def __init__(
+        self,
+        bearer_token: t.Optional[str],
+        api_url: str = API_URL,
+        retries: int = 5,
+        timeout: float = 60,
+    ):
+        import httpx
+
+        self.retries = retries
+        self.http = httpx.AsyncClient(
+            base_url=api_url,
+            headers={"Authorization": f"Bearer {bearer_token}"}
+            if bearer_token
+            else {},
+            timeout=timeout,
+        )
+
+    async def __aenter__(self) -> "Client":
+        return self
+
+    async def __aexit__(self, *args: t.Any) -> None:
+        await self.http.aclose()
+
+    async def get(
+        self, path: str, params: t.Mapping[str, t.Any], limiter: RateLimiter
+    ) -> dict[str, t.Any]:
+        import httpx
+
+        for attempt in range(self.retries + 1):
+            await limiter.acquire()
+
+            try:
+                with metrics.registry.stage("fetch"):
+                    response = await self.http.get(path, params=params)
+            except httpx.TransportError as e:
+                if attempt == self.retries:
+                    raise
+
+                print(f"Request to '{path}' failed, retrying: {e}")
+                await asyncio.sleep(2**attempt)
+                continue
+
+            limiter.update(response)
+
+            if response.status_code == 429:
+                continue
+
+            if response.status_code >= 500 and attempt < self.retries:
+                await asyncio.sleep(2**attempt)
+                continue
+
+            response.raise_for_status()
+
+            return response.json()
+
+        raise RuntimeError(f"Request to '{path}' failed after {self.retries} retries.")
@@ -1,25 +1,30 @@
+import functools
 import json
 import re
 import sys
+import time
 import typing as t
 from collections import defaultdict
 from pathlib import Path
 
 import arguebuf
-import grpc
 import pendulum
 import rich_click as click
 import typed_settings as ts
-from arg_services.mining.v1beta import entailment_pb2_grpc
 from pendulum.datetime import DateTime
 from pendulum.parser import parse as dt_parse
 from rich import print
 from rich.progress import track
 
-from xarguebuf import common
+from xarguebuf import common, metrics, pipeline, reader
 
-from . import model
+from . import index, model
 
+if t.TYPE_CHECKING:
+    from arg_services.mining.v1beta import entailment_pb2_grpc
+
+# Maximum number of graphs a writer thread serializes at once
+WRITE_BATCH_SIZE = 16
 HANDLE_PATTERN = re.compile(r"^@\w+")
 URL_PATTERN = re.compile(r"https?:\/\/t.co\/\w+")
 # https://developer.twitter.com/en/docs/twitter-api/tweets/search/api-reference/get-tweets-search-all
@@ -93,8 +98,37 @@ class Config:
     tweet: TweetConfig = TweetConfig()
 
 
+def parse_line(
+    res: t.Mapping[str, t.Any],
+    conversations: t.Optional[t.Set[str]],
+    tweets: t.Dict[str, model.Tweet],
+    users: t.Dict[str, model.User],
+) -> None:
+    data = res.get("data")
+    includes = res.get("includes")
+
+    if data is not None:
+        if not isinstance(data, list):
+            data = [data]
+
+        if includes is not None and includes.get("tweets") is not None:
+            data = [*data, *includes["tweets"]]
+
+        for tweet in data:
+            tweets[tweet["id"]] = tweet
+
+            if conversations is not None and tweet.get("conversation_id") is not None:
+                conversations.add(tweet["conversation_id"])
+
+        if includes is not None and includes.get("users") is not None:
+            for user in includes["users"]:
+                users[user["id"]] = user
+
+
 def parse_response(
-    f: t.IO[str],
+    lines: t.Iterable[t.Union[str, bytes]],
+    total: t.Optional[int] = None,
+    progress: bool = True,
 ) -> t.Tuple[
     t.Set[str],
     t.Dict[str, model.Tweet],
@@ -104,31 +138,11 @@ def parse_response(
     tweets: dict[str, model.Tweet] = {}
     users: dict[str, model.User] = {}
 
-    total_iterations = sum(1 for _ in f)
-    f.seek(0)
-
-    for line in track(f, "Reading file...", total=total_iterations):
-        res = json.loads(line)
+    if progress:
+        lines = track(lines, "Reading file...", total=total)
 
-        data = res.get("data")
-        includes = res.get("includes")
-
-        if data is not None:
-            if not isinstance(data, list):
-                data = [data]
-
-            if includes is not None and includes.get("tweets") is not None:
-                data.extend(includes["tweets"])
-
-            for tweet in data:
-                tweets[tweet["id"]] = tweet
-
-                if tweet.get("conversation_id") is not None:
-                    conversations.add(tweet["conversation_id"])
-
-            if includes is not None and includes.get("users") is not None:
-                for user in includes["users"]:
-                    users[user["id"]] = user
+    for line in lines:
+        parse_line(json.loads(line), conversations, tweets, users)
 
     return conversations, tweets, users
 
@@ -183,6 +197,37 @@ def build_atom(
     )
 
 
+def reject_tweet(
+    tweet: model.Tweet, text: t.Optional[str], config: TweetConfig
+) -> t.Optional[str]:
+    """Return the name of the first filter the tweet does not pass (if any)"""
+
+    if not text:
+        return "text"
+    if len(text) < config.min_chars:
+        return "min_chars"
+    if len(text) > config.max_chars:
+        return "max_chars"
+    if tweet["lang"] != config.language:
+        return "language"
+
+    if not (public_metrics := tweet.get("public_metrics")):
+        return "public_metrics"
+
+    likes = public_metrics.get("like_count", 0)
+    replies = public_metrics.get("reply_count", 0)
+    quotes = public_metrics.get("quote_count", 0)
+    retweets = public_metrics.get("retweet_count", 0)
+    interactions = likes + replies + quotes + retweets
+
+    if interactions < config.min_interactions:
+        return "min_interactions"
+    if interactions > config.max_interactions:
+        return "max_interactions"
+
+    return None
+
+
 def build_subtree(
     level: int,
     g: arguebuf.Graph,
@@ -192,30 +237,18 @@ def build_subtree(
     config: Config,
 ) -> None:
     for tweet in tweets[parent.id]:
-        if (
-            (text := process_tweet(tweet["text"], config.tweet.raw_text))
-            and len(text) >= config.tweet.min_chars
-            and len(text) <= config.tweet.max_chars
-            and tweet["lang"] == config.tweet.language
-        ):
+        text = process_tweet(tweet["text"], config.tweet.raw_text)
+        reason = reject_tweet(tweet, text, config.tweet)
+        metrics.registry.filtered("tweet", reason)
+
+        if reason is None and text:
             atom = build_atom(tweet, text, participants, config.tweet)
             scheme = arguebuf.SchemeNode(id=f"{atom.id},{parent.id}")
 
-            if metrics := tweet.get("public_metrics"):
-                likes = metrics.get("like_count", 0)
-                replies = metrics.get("reply_count", 0)
-                quotes = metrics.get("quote_count", 0)
-                retweets = metrics.get("retweet_count", 0)
-                interactions = likes + replies + quotes + retweets
-
-                if (
-                    interactions >= config.tweet.min_interactions
-                    and interactions <= config.tweet.max_interactions
-                ):  #  or level > 1
-                    g.add_edge(arguebuf.Edge(atom, scheme))
-                    g.add_edge(arguebuf.Edge(scheme, parent))
+            g.add_edge(arguebuf.Edge(atom, scheme))
+            g.add_edge(arguebuf.Edge(scheme, parent))
 
-                    build_subtree(level + 1, g, atom, tweets, participants, config)
+            build_subtree(level + 1, g, atom, tweets, participants, config)
 
 
 def parse_referenced_tweets(
@@ -263,23 +296,24 @@ def parse_graph(
     mc_tweet: model.Tweet,
     referenced_tweets: t.Mapping[str, t.Collection[model.Tweet]],
     participants: t.Mapping[str, arguebuf.Participant],
-    entailment_client: t.Optional[entailment_pb2_grpc.EntailmentServiceStub],
+    entailment_client: t.Optional["entailment_pb2_grpc.EntailmentServiceStub"],
     config: Config,
 ) -> arguebuf.Graph:
     g = arguebuf.Graph()
     mc_text: str = process_tweet(mc_tweet["text"], config.tweet.raw_text)
 
-    mc = build_atom(mc_tweet, mc_text, participants, config.tweet)
-    g.add_node(mc)
-    g.major_claim = mc
-    build_subtree(
-        level=1,
-        g=g,
-        parent=mc,
-        tweets=referenced_tweets,
-        participants=participants,
-        config=config,
-    )
+    with metrics.registry.stage("build"):
+        mc = build_atom(mc_tweet, mc_text, participants, config.tweet)
+        g.add_node(mc)
+        g.major_claim = mc
+        build_subtree(
+            level=1,
+            g=g,
+            parent=mc,
+            tweets=referenced_tweets,
+            participants=participants,
+            config=config,
+        )
 
     common.prune_graph(g, config.graph)
     common.predict_schemes(g, client=entailment_client)
@@ -287,6 +321,150 @@ def parse_graph(
     return g
 
 
+# The major claim tweet, the replies to every tweet and all participants
+Conversation = t.Tuple[
+    model.Tweet,
+    t.Mapping[str, t.Collection[model.Tweet]],
+    t.Mapping[str, arguebuf.Participant],
+]
+
+
+def group_conversations(
+    lines: t.Iterable[t.Union[str, bytes]],
+) -> t.Iterator[
+    t.Tuple[
+        t.Set[str],
+        t.Dict[str, model.Tweet],
+        t.Dict[str, model.User],
+    ]
+]:
+    """Split lines that are grouped by conversation into the single conversations"""
+
+    conversations: set[str] = set()
+    tweets: dict[str, model.Tweet] = {}
+    users: dict[str, model.User] = {}
+
+    for line in lines:
+        with metrics.registry.stage("read"):
+            res = json.loads(line)
+            data = res.get("data") or []
+            line_conversations = {
+                tweet["conversation_id"]
+                for tweet in (data if isinstance(data, list) else [data])
+                if tweet.get("conversation_id") is not None
+            }
+
+        if line_conversations and conversations.isdisjoint(line_conversations):
+            # Tweets that are only included (e.g., quoted ones) may belong to other
+            # conversations that are incomplete, so only the open ones are built
+            if conversations:
+                yield conversations, tweets, users
+
+            conversations, tweets, users = set(), {}, {}
+
+        conversations |= line_conversations
+
+        with metrics.registry.stage("read"):
+            # The open conversations are only taken from `data` (see above)
+            parse_line(res, None, tweets, users)
+
+    if conversations:
+        yield conversations, tweets, users
+
+
+def iter_conversations(
+    lines: t.Iterable[t.Union[str, bytes]],
+    grouped: bool = False,
+    conversation_ids: t.Optional[t.Collection[str]] = None,
+    progress: bool = True,
+) -> t.Iterator[Conversation]:
+    """Read the lines and yield every conversation together with its reply index"""
+
+    if grouped:
+        groups = group_conversations(lines)
+    else:
+        with metrics.registry.stage("read"):
+            groups = iter([parse_response(lines, progress=progress)])
+
+    for conversations, tweets, users in groups:
+        if conversation_ids is not None:
+            conversations = conversations.intersection(conversation_ids)
+
+        with metrics.registry.stage("index"):
+            referenced_tweets = parse_referenced_tweets(tweets)
+            participants = parse_participants(users)
+
+        for conversation_id in conversations:
+            if mc_tweet := tweets.get(conversation_id):
+                yield mc_tweet, referenced_tweets, participants
+
+
+def build_graph(
+    conversation: Conversation, config: Config
+) -> t.Optional[arguebuf.Graph]:
+    start = time.perf_counter()
+    mc_tweet, referenced_tweets, participants = conversation
+    g = parse_graph(mc_tweet, referenced_tweets, participants, None, config)
+    metrics.registry.observe("graph_latency", time.perf_counter() - start)
+
+    if g.major_claim is not None and common.accept_graph(g, config.graph):
+        return g
+
+    return None
+
+
+def graph_pipeline(
+    config: Config,
+    entailment_client: t.Optional["entailment_pb2_grpc.EntailmentServiceStub"] = None,
+    workers: int = 1,
+) -> pipeline.Pipeline:
+    """Pipeline that converts the items of `iter_conversations` to graphs.
+
+    Building the graphs is CPU-bound and thus done by a single thread, while the
+    requests to the entailment service are sent by `workers` threads.
+    """
+
+    stages = [pipeline.Stage("build", functools.partial(build_graph, config=config))]
+
+    if entailment_client is not None:
+        stages.append(
+            pipeline.Stage(
+                "predict",
+                functools.partial(common.predict_schemes, client=entailment_client),
+                concurrency=workers,
+            )
+        )
+
+    return pipeline.Pipeline(stages)
+
+
+def iter_graphs(
+    lines: t.Iterable[t.Union[str, bytes]],
+    config: Config = Config(),
+    entailment_client: t.Optional["entailment_pb2_grpc.EntailmentServiceStub"] = None,
+    grouped: bool = False,
+    conversation_ids: t.Optional[t.Collection[str]] = None,
+    workers: int = 1,
+    progress: bool = False,
+) -> t.Iterator[arguebuf.Graph]:
+    """Convert the lines of a `conversations.jsonl` file to graphs.
+
+    If `grouped` is set, the lines are expected to be grouped by conversation (as
+    written by `twitter download` or `twarc2 conversations`). A conversation is
+    converted as soon as a line of another conversation is read, so only a single
+    conversation is kept in memory. Otherwise, all lines are read before converting
+    them.
+
+    Only graphs matching the node limits of `config.graph` are yielded (in the
+    order they are completed). Pass `conversation_ids` to convert only specific
+    conversations. Set `progress` to show a progress bar while reading the lines.
+    """
+
+    return graph_pipeline(config, entailment_client, workers).iterate(
+        iter_conversations(lines, grouped, conversation_ids, progress)
+    )
+
+
 def conversation_path(folder: Path, mc: t.Optional[arguebuf.AtomNode]):
     assert mc is not None
 
@@ -301,16 +479,44 @@ def conversation_path(folder: Path, mc: t.Optional[arguebuf.AtomNode]):
     )
 
 
-@click.group()
-def cli():
-    pass
+def read_inputs(paths: t.Iterable[Path]) -> t.Iterator[bytes]:
+    for path in paths:
+        print(f"Processing '{path}'")
+        yield from reader.iter_lines(path)
+
+
+def read_conversations(
+    paths: t.Sequence[Path], conversation_ids: t.Iterable[str]
+) -> t.Iterator[bytes]:
+    if len(paths) != 1 or reader.is_compressed(paths[0]):
+        raise click.UsageError(
+            "Converting single conversations requires exactly one uncompressed file."
+        )
+
+    path = paths[0]
+
+    try:
+        idx = index.load_index(path)
+    except (FileNotFoundError, ValueError) as e:
+        raise click.UsageError(str(e)) from e
+
+    offsets: set[int] = set()
+
+    for conversation_id in conversation_ids:
+        try:
+            offsets.update(idx[conversation_id])
+        except (KeyError, ValueError):
+            print(f"Conversation '{conversation_id}' not found in '{path}'")
+
+    return reader.read_lines_at(path, offsets)
 
 
-@cli.command("convert")
+@click.command("convert")
 @click.argument(
-    "input_file",
-    type=click.Path(exists=True, dir_okay=False, path_type=Path),
-    # help="Path to `jsonl` file that should be processed.",
+    "input_files",
+    nargs=-1,
+    required=True,
+    # help="Paths/glob patterns of `jsonl` files that should be processed.",
 )
 @click.argument(
     "output_folder",
@@ -318,43 +524,98 @@ def cli():
     # help="Path to a folder where the processed graphs should be stored.",
 )
 @click.option("--entailment-address", hidden=True, default=None)
+@click.option(
+    "--conversation-id",
+    "selected_conversations",
+    multiple=True,
+    help=(
+        "Only convert the given conversation (can be passed multiple times). Requires"
+        " an index created by `twitter index`. Existing graphs in OUTPUT_FOLDER as"
+        " well as its `config.json` and `metrics.json` are kept."
+    ),
+)
+@click.option(
+    "--streaming",
+    is_flag=True,
+    help=(
+        "The input is grouped by conversation (as written by `twitter download`), so"
+        " every conversation is converted as soon as it has been read. This keeps the"
+        " memory usage bounded."
+    ),
+)
+@click.option(
+    "--workers",
+    default=4,
+    help="Threads that query the entailment service and write the graphs.",
+)
+@click.option(
+    "--metrics-prometheus",
+    type=click.Path(dir_okay=False, writable=True, path_type=Path),
+    default=None,
+    help=(
+        "Additionally write the run metrics to this file in the Prometheus text"
+        " format (e.g., for the textfile collector of the node exporter)."
+    ),
+)
 @ts.click_options(Config, "xarguebuf.convert")
 def convert(
     config: Config,
-    input_file: Path,
+    input_files: tuple[str, ...],
     output_folder: Path,
     entailment_address: t.Optional[str],
+    selected_conversations: tuple[str, ...],
+    streaming: bool,
+    workers: int,
+    metrics_prometheus: t.Optional[Path],
 ):
-    """Convert INPUT_FILE (.jsonl) to argument graphs and save them to OUTPUT_FOLDER"""
-    entailment_client = (
-        entailment_pb2_grpc.EntailmentServiceStub(
-            grpc.insecure_channel(entailment_address)
-        )
-        if entailment_address
-        else None
+    """Convert INPUT_FILES (.jsonl) to argument graphs and save them to OUTPUT_FOLDER
+
+    The input files may be compressed (.gz, .zst) and can be given as glob patterns
+    (e.g., 'data/*.jsonl.zst'). All files are combined before converting them.
+    """
+    try:
+        paths = reader.expand_inputs(input_files)
+    except FileNotFoundError as e:
+        raise click.BadParameter(str(e), param_hint="INPUT_FILES") from e
+
+    if selected_conversations:
+        lines = read_conversations(paths, selected_conversations)
+    else:
+        lines = read_inputs(paths)
+
+    entailment_client = common.entailment_client(entailment_address)
+
+    # The existing graphs are kept when converting single conversations, so
+    # `config.json` and `metrics.json` have to keep describing the run that created
+    # them
+    new_run = common.prepare_output(
+        output_folder, config, keep_existing=bool(selected_conversations)
     )
 
-    common.prepare_output(output_folder, config)
-
-    print(f"Processing '{input_file}'")
-
-    with input_file.open("r", encoding="utf-8") as f:
-        conversation_ids, tweets, users = parse_response(f)
-
-    referenced_tweets = parse_referenced_tweets(tweets)
-    participants = parse_participants(users)
+    grouped = streaming and not selected_conversations
+    conversations: t.Iterable[Conversation] = iter_conversations(
+        lines,
+        grouped,
+        conversation_ids=selected_conversations or None,
+        progress=True,
+    )
 
-    for conversation_id in track(conversation_ids, description="Converting tweets..."):
-        if mc_tweet := tweets.get(conversation_id):
-            g = parse_graph(
-                mc_tweet, referenced_tweets, participants, entailment_client, config
+    if not grouped:
+        # All lines are read before converting them anyway, so the progress of the
+        # conversion can be shown with a total after the one of reading
+        conversations = list(conversations)
+
+    try:
+        graph_pipeline(config, entailment_client, workers).then(
+            pipeline.Stage(
+                "serialize",
+                common.GraphWriter(output_folder, config.graph),
+                concurrency=workers,
+                batch_size=WRITE_BATCH_SIZE,
             )
-            mc = g.major_claim
-
-            if mc is not None:
-                common.serialize(
-                    g,
-                    output_folder,
-                    config.graph,
-                    mc.id,
-                )
+        ).run(track(conversations, description="Converting tweets..."))
+    finally:
+        if new_run:
+            metrics.write(output_folder, metrics_prometheus)
+        elif metrics_prometheus is not None:
+            metrics.registry.write_prometheus(metrics_prometheus)
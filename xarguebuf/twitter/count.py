@@ -1,17 +1,189 @@
+import asyncio
+import csv
+import hashlib
+import json
+import os
 import typing as t
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
 
 import rich_click as click
 from rich import print
-from twarc.client2 import Twarc2
+from rich.progress import Progress
 
+from xarguebuf.twitter import client as twitter_client
 
-@click.group()
-def cli():
-    pass
+# Full-archive counts: 300 requests per 15 minutes per app
+COUNTS_LIMIT = 300
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+# The API requires `end_time` to be at least 10 seconds before the request
+END_TIME_MARGIN = timedelta(seconds=30)
 
+Bucket = dict[str, t.Any]
 
-@cli.command()
+
+def default_cache_dir() -> Path:
+    cache_home = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+
+    return Path(cache_home) / "xarguebuf" / "counts"
+
+
+def as_utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+
+    return value.astimezone(timezone.utc)
+
+
+def format_time(value: datetime) -> str:
+    return value.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def split_windows(
+    start: datetime, end: datetime, size: timedelta
+) -> list[tuple[datetime, datetime]]:
+    """Split the range into windows whose boundaries are multiples of `size`.
+
+    Aligning the boundaries (instead of starting at `start`) ensures that queries
+    with a slightly different range share most windows and thus the cache.
+    """
+
+    windows: list[tuple[datetime, datetime]] = []
+    boundary = EPOCH + ((start - EPOCH) // size) * size
+
+    while boundary < end:
+        next_boundary = boundary + size
+        windows.append((max(start, boundary), min(end, next_boundary)))
+        boundary = next_boundary
+
+    return windows
+
+
+class Cache:
+    """Stores the counts of complete windows.
+
+    Only windows that lie in the past and span a whole, aligned `window_size` are
+    stored. The partial windows at the ends of a range differ between runs, so
+    their entries would never be read again.
+    """
+
+    def __init__(self, folder: t.Optional[Path], window_size: timedelta) -> None:
+        self.folder = folder
+        self.window_size = window_size
+
+        if folder is not None:
+            folder.mkdir(parents=True, exist_ok=True)
+
+    def _path(
+        self, query: str, granularity: str, window: tuple[datetime, datetime]
+    ) -> t.Optional[Path]:
+        if self.folder is None:
+            return None
+
+        key = json.dumps([query, granularity, *map(format_time, window)])
+
+        return self.folder / f"{hashlib.sha256(key.encode()).hexdigest()}.json"
+
+    def get(
+        self, query: str, granularity: str, window: tuple[datetime, datetime]
+    ) -> t.Optional[list[Bucket]]:
+        path = self._path(query, granularity, window)
+
+        if path is not None and path.exists():
+            return json.loads(path.read_text())
+
+        return None
+
+    def is_complete(self, window: tuple[datetime, datetime]) -> bool:
+        start, end = window
+
+        return (
+            end - start == self.window_size
+            and (start - EPOCH) % self.window_size == timedelta(0)
+            and end <= datetime.now(timezone.utc)
+        )
+
+    def set(
+        self,
+        query: str,
+        granularity: str,
+        window: tuple[datetime, datetime],
+        buckets: list[Bucket],
+    ) -> None:
+        path = self._path(query, granularity, window)
+
+        if path is not None and self.is_complete(window):
+            tmp_path = path.with_suffix(".tmp")
+            tmp_path.write_text(json.dumps(buckets))
+            tmp_path.replace(path)
+
+
+async def count_window(
+    client: twitter_client.Client,
+    query: str,
+    window: tuple[datetime, datetime],
+    granularity: str,
+    limiter: twitter_client.RateLimiter,
+) -> list[Bucket]:
+    params: dict[str, t.Any] = {
+        "query": query,
+        "start_time": format_time(window[0]),
+        "end_time": format_time(window[1]),
+        "granularity": granularity,
+    }
+    buckets: list[Bucket] = []
+
+    while True:
+        res = await client.get("tweets/counts/all", params, limiter)
+        buckets.extend(res.get("data", []))
+
+        if next_token := res.get("meta", {}).get("next_token"):
+            params["next_token"] = next_token
+        else:
+            return sorted(buckets, key=lambda bucket: bucket["start"])
+
+
+async def count_windows(
+    client: twitter_client.Client,
+    query: str,
+    windows: t.Sequence[tuple[datetime, datetime]],
+    granularity: str,
+    limiter: twitter_client.RateLimiter,
+    cache: Cache,
+) -> list[Bucket]:
+    with Progress() as progress:
+        task = progress.add_task("Counting tweets...", total=len(windows))
+
+        async def process(window: tuple[datetime, datetime]) -> list[Bucket]:
+            buckets = cache.get(query, granularity, window)
+
+            if buckets is None:
+                buckets = await count_window(
+                    client, query, window, granularity, limiter
+                )
+                cache.set(query, granularity, window, buckets)
+
+            progress.advance(task)
+
+            return buckets
+
+        results = await asyncio.gather(*(process(window) for window in windows))
+
+    return [bucket for buckets in results for bucket in buckets]
+
+
+def write_buckets(path: Path, buckets: t.Sequence[Bucket]) -> None:
+    if path.suffix == ".json":
+        with path.open("w") as fp:
+            json.dump(buckets, fp, indent=2)
+    else:
+        with path.open("w", newline="") as fp:
+            writer = csv.DictWriter(fp, fieldnames=["start", "end", "tweet_count"])
+            writer.writeheader()
+            writer.writerows(buckets)
+
+
+@click.command()
 @click.argument("query", type=str)
 @click.option(
     "--start-time",
@@ -23,25 +195,83 @@ def cli():
     type=click.DateTime(formats=("%Y-%m-%d", "%Y-%m-%dT%H:%M:%S")),
     help="Match tweets sent before UTC time (ISO 8601/RFC 3339)",
 )
+@click.option(
+    "--granularity",
+    type=click.Choice(["day", "hour"]),
+    default="day",
+    help="Granularity of the breakdown written to `--output`.",
+)
+@click.option(
+    "--window-days",
+    type=click.IntRange(min=1),
+    default=30,
+    help=(
+        "Split the time range into windows of this many days that are counted"
+        " concurrently."
+    ),
+)
+@click.option(
+    "--output",
+    type=click.Path(dir_okay=False, writable=True, path_type=Path),
+    default=None,
+    help="Store the count per day/hour in this file (`.csv` or `.json`).",
+)
+@click.option(
+    "--cache-dir",
+    type=click.Path(file_okay=False, writable=True, path_type=Path),
+    default=default_cache_dir,
+    show_default="$XDG_CACHE_HOME/xarguebuf/counts",
+    help="Folder for caching the counts of past windows.",
+)
+@click.option("--no-cache", is_flag=True, help="Neither read nor write the cache.")
+@click.option(
+    "--counts-limit",
+    default=COUNTS_LIMIT,
+    help="Requests to the counts endpoint per 15 minute window.",
+)
 @click.option(
     "--bearer-token",
     type=str,
     envvar="BEARER_TOKEN",
     help="Twitter app access bearer token.",
 )
+@click.option("--api-url", default=twitter_client.API_URL, hidden=True)
 def count(
     query: str,
-    start_time: t.Optional[datetime] = None,
-    end_time: t.Optional[datetime] = None,
-    bearer_token: t.Optional[str] = None,
+    start_time: t.Optional[datetime],
+    end_time: t.Optional[datetime],
+    granularity: str,
+    window_days: int,
+    output: t.Optional[Path],
+    cache_dir: Path,
+    no_cache: bool,
+    counts_limit: int,
+    bearer_token: t.Optional[str],
+    api_url: str,
 ):
-    client = Twarc2(bearer_token=bearer_token)
-    response = client.counts_all(
-        query,
-        start_time=start_time,
-        end_time=end_time,
-        granularity="day",
-    )
-
-    total_tweets = sum(entry["meta"]["total_tweet_count"] for entry in response)
+    # Like the API, count the last 30 days if no range is given
+    latest_end = datetime.now(timezone.utc) - END_TIME_MARGIN
+    end = min(as_utc(end_time), latest_end) if end_time else latest_end
+    start = as_utc(start_time) if start_time else end - timedelta(days=30)
+    window_size = timedelta(days=window_days)
+    windows = split_windows(start, end, window_size)
+    cache = Cache(None if no_cache else cache_dir, window_size)
+
+    async def run():
+        async with twitter_client.Client(bearer_token, api_url) as client:
+            return await count_windows(
+                client,
+                query,
+                windows,
+                granularity,
+                twitter_client.RateLimiter(counts_limit),
+                cache,
+            )
+
+    buckets = asyncio.run(run())
+
+    if output is not None:
+        write_buckets(output, buckets)
+
+    total_tweets = sum(bucket["tweet_count"] for bucket in buckets)
     print(total_tweets)
@@ -0,0 +1,320 @@
+import asyncio
+import contextlib
+import json
+import typing as t
+from datetime import datetime
+from pathlib import Path
+
+import rich_click as click
+from rich import print
+from rich.progress import Progress
+
+from xarguebuf.twitter import client as twitter_client
+
+# Elevated/academic access of the full-archive search: 300 requests per 15 minutes
+# per app and at most one request per second.
+SEARCH_LIMIT = 300
+SEARCH_INTERVAL = 1.0
+LOOKUP_LIMIT = 300
+LOOKUP_BATCH_SIZE = 100
+
+
+def read_ids(path: Path) -> list[str]:
+    with path.open("r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def downloaded_conversations(path: Path) -> set[str]:
+    """Collect the ids of all conversations already stored in `path`"""
+
+    conversations: set[str] = set()
+
+    if not path.exists():
+        return conversations
+
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                res = json.loads(line)
+            except json.JSONDecodeError:
+                # The last line may be truncated if a previous run was killed
+                continue
+
+            if conversation_id := res.get("__xarguebuf", {}).get("conversation_id"):
+                conversations.add(conversation_id)
+
+            # Files downloaded by twarc do not contain our marker
+            for tweet in res.get("data") or []:
+                if tweet.get("conversation_id") is not None:
+                    conversations.add(tweet["conversation_id"])
+
+    return conversations
+
+
+def lookup_file(output_file: Path) -> Path:
+    return output_file.with_name(f"{output_file.name}.lookup")
+
+
+def read_lookups(path: Path) -> dict[str, t.Optional[str]]:
+    """Read the conversation ids of tweets that have been looked up before"""
+
+    lookups: dict[str, t.Optional[str]] = {}
+
+    if not path.exists():
+        return lookups
+
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+            lookups[entry["id"]] = entry["conversation_id"]
+
+    return lookups
+
+
+async def lookup_conversations(
+    client: twitter_client.Client,
+    tweet_ids: t.Sequence[str],
+    limiter: twitter_client.RateLimiter,
+    cache_file: t.Optional[Path] = None,
+) -> list[str]:
+    """Look up the conversation ids of the given tweets.
+
+    The results are appended to `cache_file` and reused by later runs, so a resumed
+    download does not repeat the lookup. Batches that fail are reported and skipped.
+    """
+
+    lookups = read_lookups(cache_file) if cache_file is not None else {}
+    missing = [id for id in dict.fromkeys(tweet_ids) if id not in lookups]
+
+    with (
+        cache_file.open("a", encoding="utf-8")
+        if cache_file is not None
+        else contextlib.nullcontext()
+    ) as f:
+
+        async def lookup(batch: t.Sequence[str]) -> None:
+            try:
+                res = await client.get(
+                    "tweets",
+                    {"ids": ",".join(batch), "tweet.fields": "conversation_id"},
+                    limiter,
+                )
+            except Exception as e:
+                print(f"Error when looking up the tweets {batch[0]}...{batch[-1]}: {e}")
+                return
+
+            found = {
+                tweet["id"]: tweet["conversation_id"] for tweet in res.get("data", [])
+            }
+            # Deleted or protected tweets are stored as well to not look them up again
+            results = {id: found.get(id) for id in batch}
+            lookups.update(results)
+
+            if f is not None:
+                f.writelines(
+                    json.dumps({"id": id, "conversation_id": conversation_id}) + "\n"
+                    for id, conversation_id in results.items()
+                )
+                f.flush()
+
+        await asyncio.gather(
+            *(
+                lookup(missing[i : i + LOOKUP_BATCH_SIZE])
+                for i in range(0, len(missing), LOOKUP_BATCH_SIZE)
+            )
+        )
+
+    # Preserve the order of the input while removing duplicates
+    return list(
+        dict.fromkeys(
+            conversation_id
+            for id in tweet_ids
+            if (conversation_id := lookups.get(id)) is not None
+        )
+    )
+
+
+async def fetch_conversation(
+    client: twitter_client.Client,
+    conversation_id: str,
+    limiter: twitter_client.RateLimiter,
+    start_time: t.Optional[datetime],
+    end_time: t.Optional[datetime],
+) -> list[dict[str, t.Any]]:
+    params: dict[str, t.Any] = {
+        "query": f"conversation_id:{conversation_id}",
+        "max_results": 500,
+        "tweet.fields": twitter_client.TWEET_FIELDS,
+        "user.fields": twitter_client.USER_FIELDS,
+        "expansions": twitter_client.EXPANSIONS,
+    }
+
+    if start_time is not None:
+        params["start_time"] = start_time.strftime("%Y-%m-%dT%H:%M:%SZ")
+    if end_time is not None:
+        params["end_time"] = end_time.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    pages: list[dict[str, t.Any]] = []
+
+    while True:
+        res = await client.get("tweets/search/all", params, limiter)
+        res["__xarguebuf"] = {"conversation_id": conversation_id}
+        pages.append(res)
+
+        if next_token := res.get("meta", {}).get("next_token"):
+            params["next_token"] = next_token
+        else:
+            return pages
+
+
+async def download_conversations(
+    client: twitter_client.Client,
+    conversation_ids: t.Sequence[str],
+    output_file: Path,
+    concurrency: int,
+    search_limiter: twitter_client.RateLimiter,
+    start_time: t.Optional[datetime] = None,
+    end_time: t.Optional[datetime] = None,
+) -> None:
+    queue: asyncio.Queue[str] = asyncio.Queue()
+
+    for conversation_id in conversation_ids:
+        queue.put_nowait(conversation_id)
+
+    with output_file.open("a", encoding="utf-8") as f, Progress() as progress:
+        task = progress.add_task(
+            "Downloading conversations...", total=len(conversation_ids)
+        )
+
+        async def worker() -> None:
+            while not queue.empty():
+                conversation_id = queue.get_nowait()
+
+                try:
+                    pages = await fetch_conversation(
+                        client, conversation_id, search_limiter, start_time, end_time
+                    )
+                except Exception as e:
+                    progress.console.print(
+                        f"Error when downloading conversation {conversation_id}: {e}"
+                    )
+                else:
+                    # All pages are written at once, so that a conversation is
+                    # either complete or missing after an interruption
+                    f.writelines(json.dumps(page) + "\n" for page in pages)
+                    f.flush()
+
+                progress.advance(task)
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+@click.command("download")
+@click.argument(
+    "tweet_ids",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+)
+@click.argument(
+    "output_file",
+    type=click.Path(dir_okay=False, writable=True, path_type=Path),
+)
+@click.option(
+    "--start-time",
+    type=click.DateTime(formats=("%Y-%m-%d", "%Y-%m-%dT%H:%M:%S")),
+    help="Match tweets created after UTC time (ISO 8601/RFC 3339)",
+)
+@click.option(
+    "--end-time",
+    type=click.DateTime(formats=("%Y-%m-%d", "%Y-%m-%dT%H:%M:%S")),
+    help="Match tweets sent before UTC time (ISO 8601/RFC 3339)",
+)
+@click.option(
+    "--conversation-ids",
+    is_flag=True,
+    help="TWEET_IDS already contains conversation ids, so no lookup is needed.",
+)
+@click.option(
+    "--concurrency",
+    default=8,
+    help="Number of conversations that are paginated concurrently.",
+)
+@click.option(
+    "--search-limit",
+    default=SEARCH_LIMIT,
+    help="Requests to the full-archive search per 15 minute window.",
+)
+@click.option(
+    "--search-interval",
+    default=SEARCH_INTERVAL,
+    help="Minimum number of seconds between two search requests.",
+)
+@click.option(
+    "--lookup-limit",
+    default=LOOKUP_LIMIT,
+    help="Requests to the tweet lookup per 15 minute window.",
+)
+@click.option(
+    "--bearer-token",
+    type=str,
+    envvar="BEARER_TOKEN",
+    help="Twitter app access bearer token.",
+)
+@click.option("--api-url", default=twitter_client.API_URL, hidden=True)
+def download(
+    tweet_ids: Path,
+    output_file: Path,
+    start_time: t.Optional[datetime],
+    end_time: t.Optional[datetime],
+    conversation_ids: bool,
+    concurrency: int,
+    search_limit: int,
+    search_interval: float,
+    lookup_limit: int,
+    bearer_token: t.Optional[str],
+    api_url: str,
+):
+    """Download the conversations of all tweets in TWEET_IDS to OUTPUT_FILE (.jsonl)
+
+    Conversations that are already contained in OUTPUT_FILE are skipped, so an
+    interrupted download can be resumed by running the same command again. The
+    conversation ids of the tweets are cached next to it in `OUTPUT_FILE.lookup`.
+    """
+
+    async def run():
+        ids = read_ids(tweet_ids)
+        downloaded = downloaded_conversations(output_file)
+
+        async with twitter_client.Client(bearer_token, api_url) as client:
+            if conversation_ids:
+                pending = list(dict.fromkeys(ids))
+            else:
+                # Root tweets have the id of their conversation and need no lookup
+                remaining = [id for id in ids if id not in downloaded]
+                pending = await lookup_conversations(
+                    client,
+                    remaining,
+                    twitter_client.RateLimiter(lookup_limit),
+                    lookup_file(output_file),
+                )
+
+            pending = [id for id in pending if id not in downloaded]
+            print(
+                f"Downloading {len(pending)} conversations"
+                f" ({len(downloaded)} already downloaded)"
+            )
+
+            await download_conversations(
+                client,
+                pending,
+                output_file,
+                concurrency,
+                twitter_client.RateLimiter(search_limit, interval=search_interval),
+                start_time,
+                end_time,
+            )
+
+    asyncio.run(run())
@@ -0,0 +1,168 @@
+import json
+import struct
+import typing as t
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+from pathlib import Path
+
+import rich_click as click
+from rich import print
+from rich.progress import track
+
+from xarguebuf import reader
+
+# Layout (native byte order): magic, size and mtime of the indexed file, number of
+# conversations and offsets, followed by three arrays: the sorted conversation ids
+# (u64), the start of every conversation in the offsets array (u64, n + 1 entries)
+# and the byte offsets of the lines (u64).
+MAGIC = b"XAIDX\x01"
+HEADER = struct.Struct("=6sQQQQ")
+
+
+def index_path(path: Path) -> Path:
+    return path.with_name(f"{path.name}.idx")
+
+
+def _array(typecode: str, values: t.Iterable[int] = ()) -> array:
+    arr = array(typecode, values)
+    assert arr.itemsize == 8
+
+    return arr
+
+
+class ConversationIndex:
+    """Maps conversation ids to the byte offsets of the lines containing them"""
+
+    def __init__(
+        self, ids: array, starts: array, offsets: array, size: int, mtime: int
+    ):
+        self.ids = ids
+        self.starts = starts
+        self.offsets = offsets
+        self.size = size
+        self.mtime = mtime
+
+    @classmethod
+    def build(cls, path: Path) -> "ConversationIndex":
+        if reader.is_compressed(path):
+            raise ValueError(
+                f"Cannot index '{path}': Compressed files do not support seeking."
+            )
+
+        stat = path.stat()
+        lines: defaultdict[int, list[int]] = defaultdict(list)
+
+        for offset, line in track(
+            reader.iter_lines_with_offsets(path), "Indexing file..."
+        ):
+            res = json.loads(line)
+            data = res.get("data") or []
+            includes = res.get("includes") or {}
+
+            if not isinstance(data, list):
+                data = [data]
+
+            conversation_ids = {
+                int(tweet["conversation_id"])
+                for tweet in [*data, *(includes.get("tweets") or [])]
+                if tweet.get("conversation_id") is not None
+            }
+
+            for conversation_id in conversation_ids:
+                lines[conversation_id].append(offset)
+
+        ids = _array("Q", sorted(lines))
+        starts = _array("Q", [0])
+        offsets = _array("Q")
+
+        for conversation_id in ids:
+            offsets.extend(lines[conversation_id])
+            starts.append(len(offsets))
+
+        return cls(ids, starts, offsets, stat.st_size, stat.st_mtime_ns)
+
+    def dump(self, path: Path) -> None:
+        with path.open("wb") as f:
+            f.write(
+                HEADER.pack(
+                    MAGIC, self.size, self.mtime, len(self.ids), len(self.offsets)
+                )
+            )
+
+            for arr in (self.ids, self.starts, self.offsets):
+                f.write(arr.tobytes())
+
+    @classmethod
+    def load(cls, path: Path) -> "ConversationIndex":
+        with path.open("rb") as f:
+            magic, size, mtime, n_ids, n_offsets = HEADER.unpack(f.read(HEADER.size))
+
+            if magic != MAGIC:
+                raise ValueError(f"'{path}' is not a conversation index.")
+
+            arrays = [_array("Q") for _ in range(3)]
+
+            for arr, length in zip(arrays, (n_ids, n_ids + 1, n_offsets)):
+                arr.fromfile(f, length)
+
+        return cls(*arrays, size=size, mtime=mtime)
+
+    def is_stale(self, path: Path) -> bool:
+        stat = path.stat()
+
+        return stat.st_size != self.size or stat.st_mtime_ns != self.mtime
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, conversation_id: str) -> list[int]:
+        key = int(conversation_id)
+        pos = bisect_left(self.ids, key)
+
+        if pos == len(self.ids) or self.ids[pos] != key:
+            raise KeyError(conversation_id)
+
+        return self.offsets[self.starts[pos] : self.starts[pos + 1]].tolist()
+
+
+def load_index(path: Path) -> ConversationIndex:
+    idx_path = index_path(path)
+
+    if not idx_path.exists():
+        raise FileNotFoundError(
+            f"No index found for '{path}', run `xarguebuf twitter index` first."
+        )
+
+    idx = ConversationIndex.load(idx_path)
+
+    if idx.is_stale(path):
+        raise ValueError(
+            f"The index of '{path}' is outdated, run `xarguebuf twitter index` again."
+        )
+
+    return idx
+
+
+@click.command("index")
+@click.argument(
+    "input_file",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+)
+def index(input_file: Path):
+    """Index the lines of INPUT_FILE (.jsonl) by conversation id
+
+    The index is stored besides the file (INPUT_FILE.idx) and allows to convert
+    single conversations via `twitter convert --conversation-id`.
+    """
+
+    try:
+        idx = ConversationIndex.build(input_file)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="INPUT_FILE") from e
+
+    idx.dump(index_path(input_file))
+    print(
+        f"Indexed {len(idx)} conversations ({len(idx.offsets)} lines) in"
+        f" '{index_path(input_file)}'"
+    )
@@ -0,0 +1,282 @@
+import csv
+import itertools
+import json
+import statistics
+import typing as t
+from pathlib import Path
+
+import arguebuf
+import attrs
+import rich_click as click
+import typed_settings as ts
+from rich import print
+from rich.progress import track
+from rich.table import Table
+
+from xarguebuf import common, metrics, reader
+
+from .convert import (
+    Config,
+    parse_graph,
+    parse_participants,
+    parse_referenced_tweets,
+    parse_response,
+    read_inputs,
+)
+
+# Sections of `Config` whose fields can be varied
+SECTIONS = ("tweet", "graph")
+
+Row = dict[str, t.Any]
+
+
+def parse_grid(specs: t.Iterable[str], base: Config) -> dict[str, list[t.Any]]:
+    """Parse specifications like `tweet.min_chars=0,20` to a mapping of values"""
+
+    grid: dict[str, list[t.Any]] = {}
+
+    for spec in specs:
+        key, sep, raw_values = spec.partition("=")
+        section, _, field = key.partition(".")
+
+        if not sep or section not in SECTIONS:
+            raise ValueError(
+                f"'{spec}' must have the form 'section.field=value,...' with section"
+                f" being one of {', '.join(SECTIONS)}."
+            )
+
+        default = getattr(getattr(base, section), field, None)
+
+        if not isinstance(default, int):
+            raise ValueError(f"'{key}' is not a numeric or boolean option.")
+
+        grid[key] = [
+            _parse_value(value.strip(), type(default))
+            for value in raw_values.split(",")
+        ]
+
+    return grid
+
+
+def _parse_value(value: str, kind: type) -> t.Any:
+    if kind is bool:
+        if value.lower() not in ("true", "false"):
+            raise ValueError(f"'{value}' is not a boolean.")
+
+        return value.lower() == "true"
+
+    return int(value)
+
+
+def expand_grid(grid: t.Mapping[str, t.Sequence[t.Any]], base: Config) -> list[Config]:
+    configs: list[Config] = []
+
+    for values in itertools.product(*grid.values()):
+        changes: dict[str, dict[str, t.Any]] = {section: {} for section in SECTIONS}
+
+        for key, value in zip(grid.keys(), values):
+            section, _, field = key.partition(".")
+            changes[section][field] = value
+
+        configs.append(
+            attrs.evolve(
+                base,
+                **{
+                    section: attrs.evolve(getattr(base, section), **section_changes)
+                    for section, section_changes in changes.items()
+                },
+            )
+        )
+
+    return configs
+
+
+def option_value(config: Config, key: str) -> t.Any:
+    section, _, field = key.partition(".")
+
+    return getattr(getattr(config, section), field)
+
+
+def graph_depth(g: arguebuf.Graph) -> int:
+    """Length of the longest reply chain starting at the major claim"""
+
+    assert g.major_claim is not None
+    level: set[arguebuf.AtomNode] = {g.major_claim}
+    depth = 0
+
+    while level := {child for node in level for child in g.incoming_atom_nodes(node)}:
+        depth += 1
+
+    return depth
+
+
+def summarize(values: t.Sequence[int]) -> dict[str, float]:
+    if not values:
+        return {"min": 0, "median": 0, "p90": 0, "max": 0}
+
+    return {
+        "min": min(values),
+        "median": statistics.median(values),
+        "p90": statistics.quantiles(values, n=10, method="inclusive")[-1]
+        if len(values) > 1
+        else values[0],
+        "max": max(values),
+    }
+
+
+def write_rows(path: Path, rows: t.Sequence[Row]) -> None:
+    if path.suffix == ".json":
+        with path.open("w") as fp:
+            json.dump(rows, fp, indent=2)
+    else:
+        with path.open("w", newline="") as fp:
+            writer = csv.DictWriter(fp, fieldnames=list(rows[0].keys()))
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+@click.command("sweep")
+@click.argument("input_files", nargs=-1, required=True)
+@click.option(
+    "--grid",
+    "grid_specs",
+    multiple=True,
+    required=True,
+    help=(
+        "Values of an option to evaluate, e.g., `tweet.min_chars=0,20,40` or"
+        " `graph.min_depth=1,2`. Can be passed multiple times, all combinations are"
+        " evaluated."
+    ),
+)
+@click.option(
+    "--output",
+    type=click.Path(dir_okay=False, writable=True, path_type=Path),
+    default=None,
+    help="Additionally store the table in this file (`.csv` or `.json`).",
+)
+@click.option(
+    "--materialize",
+    type=int,
+    multiple=True,
+    help=(
+        "Store the graphs of the combination with this number (see the first column"
+        " of the table) in `--output-folder`. Can be passed multiple times."
+    ),
+)
+@click.option(
+    "--output-folder",
+    type=click.Path(writable=True, file_okay=False, path_type=Path),
+    default=None,
+    help="Folder for the graphs of `--materialize`, one subfolder per combination.",
+)
+@click.option("--entailment-address", hidden=True, default=None)
+@ts.click_options(Config, "xarguebuf.convert")
+def sweep(
+    config: Config,
+    input_files: tuple[str, ...],
+    grid_specs: tuple[str, ...],
+    output: t.Optional[Path],
+    materialize: tuple[int, ...],
+    output_folder: t.Optional[Path],
+    entailment_address: t.Optional[str],
+):
+    """Evaluate combinations of filter options on INPUT_FILES (.jsonl)
+
+    The input is read and indexed once, afterwards the graphs are built for every
+    combination of the `--grid` values. The table shows the number of accepted
+    graphs and the distribution of their size (atom nodes) and depth.
+    The remaining options serve as base for all combinations.
+    """
+
+    try:
+        paths = reader.expand_inputs(input_files)
+    except FileNotFoundError as e:
+        raise click.BadParameter(str(e), param_hint="INPUT_FILES") from e
+
+    try:
+        grid = parse_grid(grid_specs, config)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="--grid") from e
+
+    configs = expand_grid(grid, config)
+
+    if invalid := [i for i in materialize if not 1 <= i <= len(configs)]:
+        raise click.BadParameter(
+            f"There are only {len(configs)} combinations: {invalid}",
+            param_hint="--materialize",
+        )
+
+    if materialize and output_folder is None:
+        raise click.UsageError("`--materialize` requires `--output-folder`.")
+
+    with metrics.registry.stage("read"):
+        conversation_ids, tweets, users = parse_response(read_inputs(paths))
+
+    with metrics.registry.stage("index"):
+        referenced_tweets = parse_referenced_tweets(tweets)
+        participants = parse_participants(users)
+
+    mc_tweets = [tweets[id] for id in sorted(conversation_ids) if id in tweets]
+    entailment_client = common.entailment_client(entailment_address)
+    rows: list[Row] = []
+
+    for number, combination in enumerate(
+        track(configs, description="Evaluating combinations..."), start=1
+    ):
+        folder = output_folder / str(number) if output_folder else None
+        store = number in materialize and folder is not None
+        sizes: list[int] = []
+        depths: list[int] = []
+        rejected = 0
+
+        if store and folder is not None:
+            common.prepare_output(folder, combination)
+
+        for mc_tweet in mc_tweets:
+            g = parse_graph(
+                mc_tweet,
+                referenced_tweets,
+                participants,
+                # Schemes are only predicted for graphs that are stored
+                entailment_client if store else None,
+                combination,
+            )
+
+            if not common.accept_graph(g, combination.graph):
+                rejected += 1
+                continue
+
+            sizes.append(len(g.atom_nodes))
+            depths.append(graph_depth(g))
+
+            if store and folder is not None and g.major_claim is not None:
+                common.serialize(g, folder, combination.graph, g.major_claim.id)
+
+        row: Row = {
+            "number": number,
+            **{key: option_value(combination, key) for key in grid},
+            "graphs": len(sizes),
+            "rejected": rejected,
+        }
+
+        for name, values in (("nodes", sizes), ("depth", depths)):
+            row.update(
+                {f"{name}_{key}": value for key, value in summarize(values).items()}
+            )
+
+        rows.append(row)
+
+    table = Table(*rows[0].keys())
+
+    for row in rows:
+        table.add_row(
+            *(
+                f"{value:g}" if isinstance(value, float) else str(value)
+                for value in row.values()
+            )
+        )
+
+    print(table)
+
+    if output is not None:
+        write_rows(output, rows)